@@ -0,0 +1,367 @@
+"""Measure how fast the simulations step, without opening a window.
+
+Every scenario runs one simulation for a fixed number of frames, three
+times over:
+
+1. plain, to measure frames per second,
+2. with a timer around each phase of the frame (forces, near checks, ...),
+3. with tracemalloc on, to measure the peak memory.
+
+Results are printed and can be saved as JSON.  Comparing against a saved
+baseline flags every scenario that got more than --tolerance slower:
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --baseline baseline.json
+    python benchmark.py --only road --frames 100
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import checkpoint
+import particle_engines
+import road_sim
+from particle_sim import ParticleSim
+from road_sim import Car, MyCar, RoadSim
+
+
+class PhaseTimer:
+    """Adds up the time spent in each phase, not counting nested phases.
+
+    wrap() swaps a function or method for a timed version, and unwrap_all()
+    puts the originals back.
+    """
+    def __init__(self):
+        self.totals = {}
+        self.stack = []
+        self.wrapped = []
+
+    def wrap(self, owner, name: str, phase: str) -> None:
+        original = getattr(owner, name)
+        totals = self.totals
+        stack = self.stack
+        totals.setdefault(phase, 0.0)
+
+        def timed(*args, **kwargs):
+            # [time spent in phases nested inside this one]
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = stack.pop()
+                totals[phase] += elapsed - nested
+                if stack:
+                    stack[-1] += elapsed
+
+        self.wrapped.append((owner, name, owner.__dict__.get(name)))
+        setattr(owner, name, timed)
+
+    def unwrap_all(self) -> None:
+        for owner, name, original in reversed(self.wrapped):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self.wrapped = []
+
+
+# Each scenario makes a fresh simulation and returns (step, wrap_phases).
+#   step() advances one frame, wrap_phases(timer) wraps its phases.
+
+def particle_scenario(particles: int, engine: str, **engine_options):
+    def make():
+        if engine == "jit":
+            # Compile (or load from the cache) before anything is timed
+            ParticleSim(2, engine="jit").step()
+        sim = ParticleSim(particles, engine=engine, seed=1, **engine_options)
+
+        def wrap_phases(timer):
+            timer.wrap(sim.engine, "step", "forces")
+            # The loop-style engines call the module function per particle,
+            #   NumpyEngine has its own all-at-once method.
+            timer.wrap(particle_engines, "keep_on_screen", "edges and stuck")
+            if hasattr(sim.engine, "push"):
+                timer.wrap(sim.engine, "keep_on_screen", "edges and stuck")
+        return sim.step, wrap_phases
+    return make
+
+
+def populate(sim: RoadSim, cars: int) -> None:
+    """Add cars until there are about this many, or no more fit."""
+    misses = 0
+    while len(sim.cars) < cars and misses < 20:
+        car = road_sim.generate_new_car(sim)
+        if car is None:
+            misses += 1
+        else:
+            sim.add_car(car)
+
+
+def wrap_road_phases(timer: PhaseTimer, sim: RoadSim) -> None:
+    timer.wrap(Car, "move_car", "moving")
+    timer.wrap(Car, "check_near", "near checks")
+    timer.wrap(MyCar, "check_speeds", "speed shift")
+    timer.wrap(road_sim, "purge_cars", "purging")
+    timer.wrap(road_sim, "generate_new_car", "spawning")
+    timer.wrap(sim, "report", "report")
+
+
+def road_scenario(lanes: int, width: int, cars: int):
+    def make():
+        sim = RoadSim(lanes, width=width, seed=1)
+        populate(sim, cars)
+        return sim.step, lambda timer: wrap_road_phases(timer, sim)
+    return make
+
+
+def warm_road_scenario(lanes: int, width: int, cars: int, warmup: int):
+    """Like road_scenario(), but starting warmup frames in, when traffic
+    has settled.  The warm-up runs once, every run starts from a checkpoint.
+    """
+    saved = []
+
+    def make():
+        if not saved:
+            sim = RoadSim(lanes, width=width, seed=1)
+            populate(sim, cars)
+            for i in range(warmup):
+                sim.step()
+            saved.append(checkpoint.dumps(sim))
+        sim = checkpoint.loads(saved[0])
+        return sim.step, lambda timer: wrap_road_phases(timer, sim)
+    return make
+
+
+def bouncer_scenario(rects: int):
+    def make():
+        import cmu_test_2
+        # Plain objects stand in for the Rect shapes, nothing is drawn
+        bouncers = [cmu_test_2.MyRect(SimpleNamespace(left=0, top=0))
+                    for i in range(rects)]
+
+        def step():
+            for rect in bouncers:
+                rect.move_step()
+                rect.check_edges()
+
+        def wrap_phases(timer):
+            timer.wrap(cmu_test_2.MyRect, "move_step", "moving")
+            timer.wrap(cmu_test_2.MyRect, "check_edges", "edges")
+        return step, wrap_phases
+    return make
+
+
+def rect_array_scenario(rects: int):
+    def make():
+        import cmu_test_2
+        bouncers = cmu_test_2.RectArray(rects, seed=1)
+
+        def wrap_phases(timer):
+            timer.wrap(bouncers, "move_step", "moving")
+            timer.wrap(bouncers, "check_edges", "edges")
+        return bouncers.step, wrap_phases
+    return make
+
+
+def collision_scenario(rects: int, all_pairs: bool = False):
+    def make():
+        import collisions
+        import cmu_test_2
+        # Same crowding at every count: the rects cover 5% of the world
+        side = int(math.sqrt(rects) * 90)
+        bouncers = cmu_test_2.RectArray(rects, right=side, bottom=side,
+                                        seed=1, collide=True)
+        bouncers.scatter()
+        if all_pairs:
+            bouncers.finder = collisions.all_pairs
+
+        def wrap_phases(timer):
+            timer.wrap(bouncers, "move_step", "moving")
+            timer.wrap(bouncers, "check_collisions", "collisions")
+            timer.wrap(bouncers, "check_edges", "edges")
+        return bouncers.step, wrap_phases
+    return make
+
+
+def input_scenario(events_per_frame: int):
+    def make():
+        import events_demo
+        from input_queue import InputQueue
+        state = events_demo.headless_state()
+        queue = InputQueue(limit=state.max_dots)
+        # Mostly mouse moves, with a click every 50 events and a key every 500
+        pattern = [("move", (i % 400, i // 400)) for i in range(events_per_frame)]
+        for i in range(0, events_per_frame, 50):
+            pattern[i] = ("press", (i % 400, 200))
+        for i in range(0, events_per_frame, 500):
+            pattern[i] = ("key", ("space",))
+        add = {"move": queue.mouse_move, "press": queue.mouse_press,
+               "key": queue.key_press}
+
+        def step():
+            for kind, values in pattern:
+                add[kind](*values)
+            events_demo.handle_input(state, queue.drain())
+
+        def wrap_phases(timer):
+            # Whatever isn't in these is queueing the events
+            timer.wrap(queue, "drain", "draining")
+            timer.wrap(events_demo, "handle_input", "handling")
+        return step, wrap_phases
+    return make
+
+
+def dot_scenario(dots: int, queries: int):
+    def make():
+        import random
+        from dot_index import DotIndex
+        rng = random.Random(1)
+        # About 4 dots per cell and 12 within the radius, however many dots
+        #   there are
+        cell_size = 2000 / math.sqrt(dots)
+        index = DotIndex(1000, 1000, cell_size)
+        for i in range(dots):
+            index.add(rng.uniform(0, 1000), rng.uniform(0, 1000), i)
+        points = [(rng.uniform(0, 1000), rng.uniform(0, 1000))
+                  for i in range(queries)]
+
+        def step():
+            for x, y in points:
+                index.nearest(x, y)
+                index.within(x, y, cell_size)
+
+        def wrap_phases(timer):
+            timer.wrap(index, "nearest", "nearest")
+            timer.wrap(index, "within", "within")
+        return step, wrap_phases
+    return make
+
+
+# name: (how to make it, default number of frames)
+SCENARIOS = {
+    "particles-15": (particle_scenario(15, "loop"), 300),
+    "particles-100": (particle_scenario(100, "loop"), 50),
+    "particles-1k": (particle_scenario(1000, "numpy"), 10),
+    "particles-1k-jit": (particle_scenario(1000, "jit"), 10),
+    "particles-10k": (particle_scenario(10000, "numpy"), 2),
+    "road-3-lanes": (road_scenario(3, 1200, 15), 2000),
+    "road-6-lanes": (road_scenario(6, 4800, 100), 500),
+    "road-12-lanes": (road_scenario(12, 19200, 600), 100),
+    "road-6-lanes-warm": (warm_road_scenario(6, 4800, 100, 3000), 500),
+    "bouncers-4": (bouncer_scenario(4), 5000),
+    "bouncers-1k": (bouncer_scenario(1000), 200),
+    "bouncers-1k-array": (rect_array_scenario(1000), 2000),
+    "bouncers-100k-array": (rect_array_scenario(100000), 100),
+    # Checking all pairs grows with rects squared, sweep and prune doesn't
+    "collisions-1k-all-pairs": (collision_scenario(1000, all_pairs=True), 50),
+    "collisions-1k": (collision_scenario(1000), 500),
+    "collisions-10k": (collision_scenario(10000), 50),
+    "collisions-100k": (collision_scenario(100000), 10),
+    # 10k events a frame for 100 frames, a million events
+    "input-10k-per-frame": (input_scenario(10000), 100),
+    # 1000 searches a frame, the time hardly grows with the number of dots
+    "dots-1k": (dot_scenario(1000, 1000), 20),
+    "dots-100k": (dot_scenario(100000, 1000), 20),
+}
+# ParallelEngine with 1, 2, 4, ... workers up to the number of cores, to
+#   compare against each other and against particles-10k
+for workers in [2 ** i for i in range((os.cpu_count() or 1).bit_length())]:
+    SCENARIOS[f"particles-10k-parallel-{workers}"] = (
+        particle_scenario(10000, "parallel", workers=workers), 2
+    )
+
+
+def run_scenario(make, frames: int) -> dict:
+    """Run one scenario three times, see the top of this file."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        # 1. Plain speed
+        step, wrap_phases = make()
+        start = time.perf_counter()
+        for i in range(frames):
+            step()
+        seconds = time.perf_counter() - start
+        # 2. Time per phase
+        step, wrap_phases = make()
+        timer = PhaseTimer()
+        wrap_phases(timer)
+        try:
+            for i in range(frames):
+                step()
+        finally:
+            timer.unwrap_all()
+        # 3. Peak memory
+        tracemalloc.start()
+        try:
+            step, wrap_phases = make()
+            for i in range(frames):
+                step()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {
+        "frames": frames,
+        "seconds": seconds,
+        "fps": frames / seconds if seconds > 0 else float("inf"),
+        "phase_ms_per_frame": {
+            phase: 1000 * total / frames
+            for phase, total in timer.totals.items()
+        },
+        "peak_memory_kb": peak / 1024,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Names of the scenarios that are slower than baseline by > tolerance."""
+    slower = []
+    for name, result in results.items():
+        if name in baseline:
+            if result["fps"] < baseline[name]["fps"] * (1 - tolerance):
+                slower.append(name)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", default="",
+                        help="only run scenarios whose name contains this")
+    parser.add_argument("--frames", type=int,
+                        help="frames per scenario, instead of the defaults")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown vs. baseline (default 0.2)")
+    args = parser.parse_args()
+
+    results = {}
+    for name, (make, frames) in SCENARIOS.items():
+        if args.only not in name:
+            continue
+        result = run_scenario(make, args.frames or frames)
+        results[name] = result
+        phases = ", ".join(f"{phase} {ms:.2f}"
+                           for phase, ms in result["phase_ms_per_frame"].items())
+        print(f"{name:28} {result['fps']:10.1f} fps  "
+              f"{result['peak_memory_kb']:9.0f} KB peak  ms/frame: {phases}")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        slower = compare(results, baseline, args.tolerance)
+        for name in slower:
+            print(f"Slower than baseline: {name} "
+                  f"({results[name]['fps']:.1f} vs {baseline[name]['fps']:.1f} fps)")
+        if slower:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
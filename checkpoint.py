@@ -0,0 +1,157 @@
+"""Save a running simulation to a file, and carry on from there later.
+
+A checkpoint holds everything needed to continue exactly where the
+simulation was: every car or particle, the frame counter and the state of
+the random number generator.  Continuing from a checkpoint gives the same
+frames as if the simulation had never stopped.
+
+    save_checkpoint(sim, "rush_hour.ckpt")
+    ...
+    sim = load_checkpoint("rush_hour.ckpt")
+
+Shapes are not saved, whoever draws the simulation makes them again as it
+needs them.  Neither are Stats, telemetry or TrafficStats: pass them to
+load_checkpoint() to use them in the loaded simulation.
+
+The file is the simulation's state as plain tuples and numbers, pickled and
+compressed.  Only load checkpoints you made yourself, like any pickle.
+"""
+import pickle
+import random
+import zlib
+
+from instrument import Stats
+from lane_index import LaneIndex
+from particle_engines import make_engine
+from particle_sim import Edge, Particle, ParticleSim
+from road_sim import Car, MyCar, OtherCar, RoadSim
+
+MAGIC = b"CKP1"
+# Every car attribute except sim, in a fixed order
+CAR_FIELDS = tuple(name for name in Car.__slots__ if name != "sim")
+
+
+def road_state(sim: RoadSim) -> tuple:
+    """Everything a RoadSim knows, as plain data."""
+    cars = [tuple(getattr(car, name) for name in CAR_FIELDS)
+            for car in sim.cars.values()]
+    me = tuple(getattr(sim.me, name) for name in CAR_FIELDS)
+    return ("road", sim.rng.getstate(), sim.NEAR_TEST, sim.lanes, sim.width,
+            sim.frames, sim.spawn_every, sim.next_id, me, cars)
+
+
+def restore_road(state: tuple, stats=None, telemetry=None,
+                 traffic=None) -> RoadSim:
+    """A RoadSim that carries on from road_state()."""
+    (kind, rng_state, near_test, lanes, width, frames, spawn_every, next_id,
+     me, cars) = state
+    # Skip __init__, it would place new random cars
+    sim = RoadSim.__new__(RoadSim)
+    sim.rng = random.Random()
+    sim.rng.setstate(rng_state)
+    sim.stats = stats if stats is not None else Stats(report_every=800)
+    sim.telemetry = telemetry
+    sim.traffic = traffic
+    sim.NEAR_TEST = near_test
+    sim.lanes = lanes
+    sim.width = width
+    sim.height = 100*lanes + 100
+    sim.frames = frames
+    sim.spawn_every = spawn_every
+    sim.next_id = next_id
+    sim.cars = {}
+    sim.index = LaneIndex()
+    sim.removed_cars = []
+    sim.me = _restore_car(MyCar, sim, me)
+    sim.index.add(sim.me)
+    for values in cars:
+        sim.add_car(_restore_car(OtherCar, sim, values))
+    return sim
+
+
+def _restore_car(cls, sim: RoadSim, values: tuple) -> Car:
+    car = cls.__new__(cls)
+    car.sim = sim
+    for name, value in zip(CAR_FIELDS, values):
+        setattr(car, name, value)
+    # Sets are mutable, don't share them with the state tuple
+    car.stuck_behind = set(car.stuck_behind)
+    return car
+
+
+def particle_state(sim: ParticleSim) -> tuple:
+    """Everything a ParticleSim knows, as plain data."""
+    particles = [(p.x, p.y, p.repel_const, p.stuck) for p in sim.moving()]
+    return ("particles", sim.rng.getstate(), sim.particles, sim.width,
+            sim.height, sim.edge_repel, sim.frames, sim.engine_name,
+            sim.engine_options, particles)
+
+
+def restore_particles(state: tuple, stats=None) -> ParticleSim:
+    """A ParticleSim that carries on from particle_state()."""
+    (kind, rng_state, count, width, height, edge_repel, frames, engine_name,
+     engine_options, particles) = state
+    # Skip __init__, it would place new random particles
+    sim = ParticleSim.__new__(ParticleSim)
+    sim.rng = random.Random()
+    sim.rng.setstate(rng_state)
+    sim.stats = stats if stats is not None else Stats(report_every=300)
+    sim.particles = count
+    sim.width = width
+    sim.height = height
+    sim.edge_repel = edge_repel
+    sim.frames = frames
+    sim.objs = [Edge(x = 0, repel_const = edge_repel),
+                Edge(x = width, repel_const = edge_repel),
+                Edge(y = 0, repel_const = edge_repel),
+                Edge(y = height, repel_const = edge_repel)]
+    for x, y, repel_const, stuck in particles:
+        # Particle works out repel_const itself, put the saved one back
+        particle = Particle(x, y, count, sim.rng)
+        particle.repel_const = repel_const
+        particle.stuck = stuck
+        sim.objs.append(particle)
+    sim.engine_name = engine_name
+    sim.engine_options = engine_options
+    sim.engine = make_engine(engine_name, sim.objs, width, height,
+                             **engine_options)
+    return sim
+
+
+def dumps(sim) -> bytes:
+    """A checkpoint of a RoadSim or ParticleSim, as bytes."""
+    if isinstance(sim, RoadSim):
+        state = road_state(sim)
+    elif isinstance(sim, ParticleSim):
+        state = particle_state(sim)
+    else:
+        err_str = f"Can't make a checkpoint of {type(sim).__name__}. "
+        err_str += "Only RoadSim and ParticleSim can be saved."
+        raise ValueError(err_str)
+    data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+    return MAGIC + zlib.compress(data, 1)
+
+
+def loads(data: bytes, **options):
+    """The simulation saved by dumps(), carrying on where it was.
+
+    options go to restore_road() or restore_particles(), e.g. stats.
+    """
+    if data[:4] != MAGIC:
+        raise ValueError("Not a checkpoint.")
+    state = pickle.loads(zlib.decompress(data[4:]))
+    if state[0] == "road":
+        return restore_road(state, **options)
+    return restore_particles(state, **options)
+
+
+def save_checkpoint(sim, path: str) -> None:
+    """Save sim to a file."""
+    with open(path, "wb") as file:
+        file.write(dumps(sim))
+
+
+def load_checkpoint(path: str, **options):
+    """The simulation saved in a file, see loads()."""
+    with open(path, "rb") as file:
+        return loads(file.read(), **options)
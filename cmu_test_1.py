@@ -1,6 +1,6 @@
 from random import randrange
 import math
-from cmu_graphics import *
+import graphics
 
 def setup():
     """Steps to take before the animation starts."""
@@ -30,6 +30,10 @@ def onStep():
         else: app.r.top = 0
         print(app.x_speed, app.y_speed, app.r.left, app.r.top)
 
-setup()
+def main():
+    graphics.load(globals())
+    setup()
+    cmu_graphics.run()
 
-cmu_graphics.run()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,34 @@
 from random import randrange
 import math
-import cmu_graphics
+
+import collisions
+import graphics
+
+try:
+    import numpy as np
+except ImportError:
+    # Only RectArray needs NumPy, MyRect works without it
+    np = None
 
 class MyRect:
-    """Rectangles that move across the graphics window and bounce at edges."""
-    def __init__(self):
+    """Rectangles that move across the graphics window and bounce at edges.
+
+    right and bottom are the largest left and top the rectangle may have,
+    380 keeps a 20 pixel rectangle inside a 400 pixel window.  Bounces are
+    counted in self.bounces, and also printed if log is True.
+    """
+    def __init__(self, rect=None, right: int = 380, bottom: int = 380,
+                 log: bool = False):
         # Start at (0, 0).  Width & height both 20 pixels.
-        self.rect = cmu_graphics.Rect(0, 0, 20, 20)
+        # Anything with a left and top works as the rect, e.g. when testing.
+        #   Rect itself is only there once main() loaded cmu_graphics.
+        if rect is None:
+            rect = Rect(0, 0, 20, 20)
+        self.rect = rect
+        self.right = right
+        self.bottom = bottom
+        self.log = log
+        self.bounces = 0
         self.x_speed = randrange(1, 10)
         self.y_speed = randrange(1, 10)
     
@@ -18,35 +40,143 @@ class MyRect:
     def check_edges(self) -> None:
         """Bounce when the rectangle hits the edge of the screen."""
         # Bounce when the rectangle hit the left or right wall
-        if self.rect.left > 380 or self.rect.left < 0:
+        if self.rect.left > self.right or self.rect.left < 0:
             self.x_speed *= -1
             self.x_speed = int(math.copysign(randrange(1, 10), self.x_speed))
-            if self.rect.left > 380: self.rect.left = 380
+            if self.rect.left > self.right: self.rect.left = self.right
             else: self.rect.left = 0
-            print(self.x_speed, self.y_speed, self.rect.left, self.rect.top)
+            self.bounced()
         # Bounce when the rectangle hits the top and bottom wall
-        if self.rect.top > 380 or self.rect.top < 0:
+        if self.rect.top > self.bottom or self.rect.top < 0:
             self.y_speed *= -1
             self.y_speed = int(math.copysign(randrange(1,10), self.y_speed))
-            if self.rect.top > 380: self.rect.top = 380
+            if self.rect.top > self.bottom: self.rect.top = self.bottom
             else: self.rect.top = 0
+            self.bounced()
+
+    def bounced(self) -> None:
+        self.bounces += 1
+        if self.log:
             print(self.x_speed, self.y_speed, self.rect.left, self.rect.top)
 
+class RectArray:
+    """Many MyRects at once, kept in NumPy arrays instead of objects.
+
+    left, top, x_speed and y_speed hold one value per rectangle.  Each
+    step moves all of them, then every rectangle past an edge bounces back
+    with a new random speed, just like MyRect.  Nothing is drawn here,
+    move_shapes() copies the positions to Rect shapes when wanted.
+
+    With collide=True the rectangles, squares of size pixels, also bounce
+    off each other, see collisions.py.  They all start at (0, 0) on top of
+    each other, so call scatter() first.
+    """
+    def __init__(self, count: int, right: int = 380, bottom: int = 380,
+                 seed=None, collide: bool = False, size: int = 20):
+        if np is None:
+            raise ImportError("RectArray needs numpy, try: pip install numpy")
+        self.right = right
+        self.bottom = bottom
+        self.rng = np.random.default_rng(seed)
+        # Everyone starts at (0, 0), like MyRect
+        self.left = np.zeros(count, dtype=int)
+        self.top = np.zeros(count, dtype=int)
+        self.x_speed = self.rng.integers(1, 10, count)
+        self.y_speed = self.rng.integers(1, 10, count)
+        self.bounces = 0
+        self.collide = collide
+        self.size = size
+        # How overlapping pairs are found, collisions.all_pairs to compare
+        self.finder = collisions.find_pairs
+        # Pairs of rectangles that bounced off each other
+        self.collided = 0
+
+    def __len__(self) -> int:
+        return len(self.left)
+
+    def scatter(self) -> None:
+        """Put every rectangle at a random place on the screen."""
+        self.left = self.rng.integers(0, self.right + 1, len(self))
+        self.top = self.rng.integers(0, self.bottom + 1, len(self))
+
+    def move_step(self) -> None:
+        """Move every rectangle by its speed."""
+        self.left += self.x_speed
+        self.top += self.y_speed
+
+    def check_edges(self) -> None:
+        """Bounce every rectangle that went past an edge."""
+        self._bounce(self.left, self.x_speed, self.right)
+        self._bounce(self.top, self.y_speed, self.bottom)
+
+    def _bounce(self, position, speed, highest: int) -> None:
+        out = (position > highest) | (position < 0)
+        count = int(np.count_nonzero(out))
+        if count == 0:
+            return
+        # Turn around, with a new random speed
+        new_speed = self.rng.integers(1, 10, count)
+        speed[out] = np.where(speed[out] > 0, -new_speed, new_speed)
+        np.clip(position, 0, highest, out=position)
+        self.bounces += count
+
+    def check_collisions(self) -> None:
+        """Bounce the rectangles that overlap off each other."""
+        self.collided += collisions.collide(self.left, self.top, self.x_speed,
+                                            self.y_speed, self.size,
+                                            self.finder)
+
+    def step(self) -> None:
+        self.move_step()
+        if self.collide:
+            self.check_collisions()
+        self.check_edges()
+
+    def move_shapes(self, shapes: list) -> None:
+        """Put shapes[i] where rectangle i is."""
+        for shape, left, top in zip(shapes, self.left.tolist(),
+                                    self.top.tolist()):
+            shape.left = left
+            shape.top = top
+
 def setup():
-    cmu_graphics.app.rects = []
-    cmu_graphics.app.frames = 0
-    for i in range(4):
-        cmu_graphics.app.rects.append(MyRect())
-    cmu_graphics.app.label = cmu_graphics.Label("1", 100, 100)
+    app.rect_count = 4
+    # Set use_array to True to move all the rects at once with NumPy (see
+    #   RectArray), e.g. to stress test with thousands of them
+    app.use_array = False
+    # Set collide to True to have the rects bounce off each other too (see
+    #   collisions.py).  They start spread out instead of all at (0, 0).
+    #   Only RectArray collides, so this moves them with NumPy as well.
+    app.collide = False
+    if app.use_array or app.collide:
+        app.use_array = True
+        app.rects = RectArray(app.rect_count, right=app.width - 20,
+                              bottom=app.height - 20, collide=app.collide)
+        if app.collide:
+            app.rects.scatter()
+        app.shapes = [Rect(0, 0, 20, 20) for i in range(app.rect_count)]
+    else:
+        app.rects = [MyRect(right=app.width - 20, bottom=app.height - 20)
+                     for i in range(app.rect_count)]
+    app.frames = 0
+    app.label = Label("1", 100, 100)
 
 def onStep():
-    cmu_graphics.app.frames += 1
-    for rect in cmu_graphics.app.rects:
-        rect.move_step()
-        rect.check_edges()
-    if cmu_graphics.app.frames % 30 == 0:
-        cmu_graphics.app.label.value+="1"
+    app.frames += 1
+    if app.use_array:
+        app.rects.step()
+        app.rects.move_shapes(app.shapes)
+    else:
+        for rect in app.rects:
+            rect.move_step()
+            rect.check_edges()
+    if app.frames % 30 == 0:
+        app.label.value+="1"
 
-setup()
+def main():
+    graphics.load(globals())
+    setup()
+    cmu_graphics.run()
 
-cmu_graphics.cmu_graphics.run()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Find rectangles that overlap, and bounce them off each other.
+
+Checking every pair of n rectangles takes n * n / 2 checks, which is
+already 50 million for 10 thousand rectangles.  Sweep and prune avoids
+most of them:
+
+1. Cut the world into strips as tall as a rectangle.  Two rectangles can
+   only overlap if they are in the same strip or in strips next to each
+   other.
+2. Sort the rectangles by strip, and by left within a strip.
+3. For each rectangle, binary search the sorted list for the few that
+   start less than a rectangle's width away, in its own strip and in the
+   strip below.  Those are the candidate pairs.
+4. Keep the candidates whose tops are close enough as well.
+
+All the rectangles are squares of the same size, like the 20 pixel MyRects.
+The positions are NumPy arrays, e.g. RectArray.left and RectArray.top, so
+the steps above run for all rectangles at once.
+
+Overlapping rectangles bounce like billiard balls of the same weight: they
+swap their speeds along the side where they overlap least, and are pushed
+apart so they no longer overlap.
+
+    python collisions.py
+
+checks that sweep and prune finds the same pairs as checking all of them.
+"""
+try:
+    import numpy as np
+except ImportError:
+    # Without NumPy there are no arrays to collide
+    np = None
+
+
+def find_pairs(left, top, size: float = 20):
+    """Every pair of overlapping squares, as two arrays of indices i < j."""
+    n = len(left)
+    if n < 2:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    low = left.min()
+    # Wider than any row, so strip * row_width + left sorts by strip first
+    row_width = left.max() - low + 2*size + 1
+    strip = (top - top.min()) // size
+    keys = strip * row_width + (left - low)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    here = np.arange(n)
+    # Same strip: the ones after me starting less than size to my right
+    same_end = np.searchsorted(keys, keys + size, side="left")
+    # Strip below: starting less than size to my left or right
+    below_start = np.searchsorted(keys, keys + row_width - size, side="right")
+    below_end = np.searchsorted(keys, keys + row_width + size, side="left")
+    same, same_other = _expand(here + 1, same_end)
+    below, below_other = _expand(below_start, below_end)
+    a = order[np.concatenate([same, below])]
+    b = order[np.concatenate([same_other, below_other])]
+    # The candidates overlap left to right, check top to bottom
+    hit = np.abs(top[a] - top[b]) < size
+    a = a[hit]
+    b = b[hit]
+    return np.minimum(a, b), np.maximum(a, b)
+
+
+def _expand(starts, ends) -> tuple:
+    """(owners, positions) for every position in range(starts[k], ends[k])."""
+    counts = np.maximum(ends - starts, 0)
+    owners = np.repeat(np.arange(len(starts)), counts)
+    # Where each owner's run begins in the output
+    begins = np.cumsum(counts) - counts
+    positions = np.arange(counts.sum()) - np.repeat(begins, counts)
+    positions += np.repeat(starts, counts)
+    return owners, positions
+
+
+def all_pairs(left, top, size: float = 20):
+    """Same as find_pairs(), by checking every pair.  Only for small n."""
+    a, b = np.triu_indices(len(left), 1)
+    hit = (np.abs(left[a] - left[b]) < size) & (np.abs(top[a] - top[b]) < size)
+    return a[hit], b[hit]
+
+
+def collide(left, top, x_speed, y_speed, size: float = 20,
+            finder=find_pairs) -> int:
+    """Bounce every overlapping pair, changing the arrays in place.
+
+    finder finds the pairs, all_pairs works too, to compare.  Returns how
+    many pairs bounced.
+    """
+    a, b = finder(left, top, size)
+    if len(a) == 0:
+        return 0
+    # Only the rectangles that touch someone, as lists, which are much
+    #   quicker than arrays to change one value at a time
+    involved = np.unique(np.concatenate([a, b]))
+    local = {index: k for k, index in enumerate(involved.tolist())}
+    xs = left[involved].tolist()
+    ys = top[involved].tolist()
+    vxs = x_speed[involved].tolist()
+    vys = y_speed[involved].tolist()
+    bounced = 0
+    for i, j in zip(a.tolist(), b.tolist()):
+        i = local[i]
+        j = local[j]
+        dx = xs[j] - xs[i]
+        dy = ys[j] - ys[i]
+        overlap_x = size - abs(dx)
+        overlap_y = size - abs(dy)
+        # An earlier bounce this frame may have pushed them apart already
+        if overlap_x <= 0 or overlap_y <= 0:
+            continue
+        bounced += 1
+        if overlap_x < overlap_y:
+            xs[i], xs[j] = _push_apart(xs[i], xs[j], dx, overlap_x)
+            # Swap speeds, unless they are already moving apart
+            if (vxs[j] - vxs[i]) * dx < 0:
+                vxs[i], vxs[j] = vxs[j], vxs[i]
+        else:
+            ys[i], ys[j] = _push_apart(ys[i], ys[j], dy, overlap_y)
+            if (vys[j] - vys[i]) * dy < 0:
+                vys[i], vys[j] = vys[j], vys[i]
+    left[involved] = xs
+    top[involved] = ys
+    x_speed[involved] = vxs
+    y_speed[involved] = vys
+    return bounced
+
+
+def _push_apart(first: float, second: float, gap: float,
+                overlap: float) -> tuple:
+    """Move first and second half the overlap each, away from each other."""
+    half = overlap // 2
+    if gap < 0:
+        return first + half, second - (overlap - half)
+    return first - half, second + (overlap - half)
+
+
+def main():
+    """Check find_pairs() against all_pairs() on random squares."""
+    rng = np.random.default_rng(1)
+    for count, side in ((10, 60), (500, 400), (2000, 1000), (2000, 300)):
+        for kind in (int, float):
+            left = rng.uniform(-10, side, count).astype(kind)
+            top = rng.uniform(-10, side, count).astype(kind)
+            found = set(zip(*(part.tolist()
+                              for part in find_pairs(left, top))))
+            every = set(zip(*(part.tolist()
+                              for part in all_pairs(left, top))))
+            print(f"{count} squares in {side} x {side}, {kind.__name__}: "
+                  f"{len(every)} pairs")
+            assert found == every, "sweep and prune missed or added pairs"
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Find the dots near a point quickly, however many dots there are.
+
+events_demo.py leaves a dot behind for every click.  To find the dot under
+the cursor, looking at every dot on every mouse move gets slower with each
+click.  A DotIndex files the dots in a SpatialGrid instead, so a search
+only looks at the cells around the point:
+
+    dots = DotIndex(400, 400, capacity=500)
+    dots.add(120, 80, dot)
+    dots.nearest(118, 83, max_distance=10)   # dot
+    dots.within(100, 100, 50)                # [dot]
+
+The dots are kept oldest first.  With a capacity, adding one more dot
+than that forgets the oldest one, so a long session doesn't keep growing.
+"""
+import math
+from collections import OrderedDict
+
+from spatial_grid import SpatialGrid
+
+
+class DotIndex:
+    """Dots filed by position in a width x height window.
+
+    A dot can be any object, e.g. a Circle, and is given with its position.
+    capacity: most dots kept, None for no limit.
+    """
+    def __init__(self, width: int, height: int, cell_size: float = 40,
+                 capacity: int = None):
+        if capacity is not None and capacity < 1:
+            err_str = f"Can't create DotIndex with capacity {capacity}. "
+            err_str += "Use a capacity of at least 1, or None for no limit."
+            raise ValueError(err_str)
+        self.grid = SpatialGrid(width, height, cell_size)
+        self.capacity = capacity
+        # key: (x, y, dot), oldest first.  Keys are numbers, since the dots
+        #   themselves may not be hashable.
+        self.dots = OrderedDict()
+        self.next_key = 0
+
+    def __len__(self) -> int:
+        return len(self.dots)
+
+    def __iter__(self):
+        """Every dot, oldest first."""
+        for x, y, dot in self.dots.values():
+            yield dot
+
+    def full(self) -> bool:
+        return self.capacity is not None and len(self.dots) >= self.capacity
+
+    def add(self, x: float, y: float, dot):
+        """File dot at (x, y).  Returns the dot forgotten to make room, or None."""
+        oldest = self.pop_oldest() if self.full() else None
+        key = self.next_key
+        self.next_key += 1
+        self.dots[key] = (x, y, dot)
+        self.grid.insert(key, x, y)
+        return oldest
+
+    def pop_oldest(self):
+        """Forget the oldest dot and return it."""
+        key, (x, y, dot) = self.dots.popitem(last=False)
+        self.grid.remove(key)
+        return dot
+
+    def nearest(self, x: float, y: float, max_distance: float = math.inf):
+        """The dot closest to (x, y), or None if none is within max_distance.
+
+        Looks at the cells around (x, y) ring by ring, and stops as soon as
+        no dot in the next ring could be closer than the best one so far.
+        Exact as long as the dots are inside the window.
+        """
+        if not self.dots:
+            return None
+        cell_size = self.grid.cell_size
+        best = None
+        best_distance = max_distance
+        for reach in range(max(self.grid.cols, self.grid.rows)):
+            for key in self.grid.ring(x, y, reach):
+                dot_x, dot_y, dot = self.dots[key]
+                distance = math.dist((x, y), (dot_x, dot_y))
+                if distance <= best_distance:
+                    best = dot
+                    best_distance = distance
+            # Every dot not looked at yet is at least this far away
+            if best_distance <= reach * cell_size:
+                break
+        return best
+
+    def within(self, x: float, y: float, radius: float) -> list:
+        """Every dot at most radius away from (x, y), oldest first."""
+        reach = math.ceil(radius / self.grid.cell_size)
+        dots = self.dots
+        # Keys go up with age, so sorting them puts the oldest first
+        keys = []
+        for key in self.grid.near(x, y, reach):
+            dot_x, dot_y, dot = dots[key]
+            if (dot_x - x)**2 + (dot_y - y)**2 <= radius * radius:
+                keys.append(key)
+        keys.sort()
+        return [dots[key][2] for key in keys]
@@ -0,0 +1,168 @@
+"""Run many headless road simulations at once, spread over all CPU cores.
+
+Every combination of lanes, NEAR_TEST distance and spawn interval is run
+once per seed, each run in its own worker process, and runs don't share
+anything.  As each run finishes its numbers are printed right away, and at
+the end the runs with the same settings are averaged into one table:
+
+    python ensemble.py --lanes 3 6 --near-test 160 240 --seeds 8
+    python ensemble.py --spawn-every 80 160 --frames 20000 --output runs.csv
+"""
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import time
+
+from instrument import Stats
+from road_sim import RoadSim
+
+# Car speeds are sampled every this many frames for the average speed
+SPEED_SAMPLE_EVERY = 10
+
+# The settings that make up one run, in table order
+PARAMS = ("lanes", "width", "near_test", "spawn_every", "seed", "frames")
+# What each run reports, in table order
+RESULTS = ("cars_passed", "cars_passed_me", "avg_speed", "lane_changes",
+           "disasters", "seconds")
+
+
+def run_one(params: dict) -> dict:
+    """Run one simulation and boil it down to a row of numbers.
+
+    cars_passed counts cars that fell off the back of the road (I passed
+    them), cars_passed_me the ones that drove off the front.  avg_speed is
+    the average speed of the other cars relative to mine, so positive means
+    they are slower than me.
+    """
+    start = time.perf_counter()
+    # Counters only, nothing gets printed: disasters are counted, not shown
+    stats = Stats(enabled=True, path=os.devnull)
+    sim = RoadSim(params["lanes"], width=params["width"],
+                  near_test=params["near_test"], seed=params["seed"],
+                  stats=stats, spawn_every=params["spawn_every"])
+    passed = 0
+    passed_me = 0
+    speed_total = 0.0
+    speed_samples = 0
+    for i in range(params["frames"]):
+        sim.step()
+        for car in sim.removed_cars:
+            if car.x > sim.width:
+                passed += 1
+            else:
+                passed_me += 1
+        if sim.frames % SPEED_SAMPLE_EVERY == 0:
+            for car in sim.cars.values():
+                speed_total += car.speed
+            speed_samples += len(sim.cars)
+    row = dict(params)
+    row["cars_passed"] = passed
+    row["cars_passed_me"] = passed_me
+    row["avg_speed"] = speed_total / speed_samples if speed_samples else 0.0
+    row["lane_changes"] = stats.counters.get("lane changes", 0)
+    row["disasters"] = stats.counters.get("disasters", 0)
+    row["seconds"] = time.perf_counter() - start
+    return row
+
+
+def make_runs(lanes: list, near_tests: list, spawn_everys: list, seeds: int,
+              frames: int, width: int = 1200) -> list:
+    """One parameter dict for every combination, times every seed."""
+    runs = []
+    for lane_count, near_test, spawn_every, seed in itertools.product(
+            lanes, near_tests, spawn_everys, range(seeds)):
+        runs.append({"lanes": lane_count, "width": width,
+                     "near_test": near_test, "spawn_every": spawn_every,
+                     "seed": seed, "frames": frames})
+    return runs
+
+
+def run_all(runs: list, workers: int = None):
+    """Run every simulation in a pool of workers, yield rows as they finish.
+
+    The rows come back in whatever order the runs finish, not the order of
+    runs.  workers=1 runs everything in this process, which is easier to
+    debug and profile.
+    """
+    if workers == 1:
+        for params in runs:
+            yield run_one(params)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        # chunksize 1 hands out runs one at a time, so a worker that got
+        #   quick runs picks up more instead of idling at the end
+        yield from pool.imap_unordered(run_one, runs, chunksize=1)
+
+
+def merge(rows: list) -> list:
+    """Average the runs that differ only by seed into one row each."""
+    groups = {}
+    for row in rows:
+        key = tuple(row[name] for name in PARAMS if name != "seed")
+        groups.setdefault(key, []).append(row)
+    merged = []
+    for key in sorted(groups):
+        group = groups[key]
+        row = dict(zip([name for name in PARAMS if name != "seed"], key))
+        row["runs"] = len(group)
+        for name in RESULTS:
+            row[name] = sum(r[name] for r in group) / len(group)
+        merged.append(row)
+    return merged
+
+
+def format_table(rows: list) -> str:
+    """Rows as text columns, numbers right-aligned."""
+    if not rows:
+        return ""
+    names = list(rows[0])
+    cells = [[f"{row[name]:.3f}" if isinstance(row[name], float)
+              else str(row[name]) for name in names] for row in rows]
+    widths = [max(len(name), *(len(line[i]) for line in cells))
+              for i, name in enumerate(names)]
+    lines = ["  ".join(name.rjust(w) for name, w in zip(names, widths))]
+    for line in cells:
+        lines.append("  ".join(cell.rjust(w) for cell, w in zip(line, widths)))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lanes", type=int, nargs="+", default=[3])
+    parser.add_argument("--near-test", type=int, nargs="+", default=[240])
+    parser.add_argument("--spawn-every", type=int, nargs="+", default=[160],
+                        help="frames between attempts to add a car")
+    parser.add_argument("--seeds", type=int, default=4,
+                        help="runs per combination, seeded 0, 1, 2, ...")
+    parser.add_argument("--frames", type=int, default=5000)
+    parser.add_argument("--width", type=int, default=1200)
+    parser.add_argument("--workers", type=int,
+                        help="worker processes (default: one per core)")
+    parser.add_argument("--output", help="save every run to this CSV file")
+    args = parser.parse_args()
+
+    runs = make_runs(args.lanes, args.near_test, args.spawn_every, args.seeds,
+                     args.frames, args.width)
+    start = time.perf_counter()
+    rows = []
+    for row in run_all(runs, args.workers):
+        rows.append(row)
+        print(f"[{len(rows)}/{len(runs)}] lanes {row['lanes']} "
+              f"near {row['near_test']} spawn {row['spawn_every']} "
+              f"seed {row['seed']}: passed {row['cars_passed']}, "
+              f"passed me {row['cars_passed_me']}, "
+              f"lane changes {row['lane_changes']}, "
+              f"disasters {row['disasters']}", flush=True)
+    print(f"{len(runs)} runs in {time.perf_counter() - start:.1f} s")
+    print(format_table(merge(rows)))
+    if args.output:
+        rows.sort(key=lambda row: tuple(row[name] for name in PARAMS))
+        with open(args.output, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=PARAMS + RESULTS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,141 @@
-from cmu_graphics import *
+import argparse
+import time
+from types import SimpleNamespace
+
+import graphics
+from dot_index import DotIndex
+from input_queue import InputQueue, read_input, replay
+from shape_pool import ShapePool
+
+# cmu_graphics is only loaded by main(), see graphics.py.
 
 def setup():
-    # Make a list of Circles that are left behind each time you click.
-    app.clicked_dots = []
-    app.cursor = Star(0, 0, 20, 5, fill='red')
-    app.my_colors = ['white', 'red', 'blue', 'green', 'black', 'gray',  
+    # File name to record every mouse and key event to, or None
+    app.record = None
+    start(app, lambda x, y: Circle(x, y, 10, fill='green'),
+          Star(0, 0, 20, 5, fill='red'), app.width, app.height)
+    # The event functions below only queue events, onStep handles them
+    app.inputs = InputQueue(limit=app.max_dots, record=app.record)
+
+def start(state, make_dot, cursor, width: int = 400,
+          height: int = 400) -> None:
+    """Set up state, which is app or anything else that can hold the same.
+
+    make_dot(x, y) makes a dot shape and cursor is the shape that follows
+    the mouse.  Without a window, e.g. when replaying, any object with
+    centerX, centerY, fill and visible will do for both.
+    """
+    # Keep the Circles that are left behind each time you click, filed by
+    #   position.  Once there are max_dots, the oldest one is reused.
+    state.max_dots = 500
+    state.dot_pool = ShapePool(make_dot, capacity=state.max_dots)
+    state.clicked_dots = DotIndex(width, height, capacity=state.max_dots)
+    # The dot under the cursor, drawn in another color
+    state.hovered = None
+    state.cursor = cursor
+    state.my_colors = ['white', 'red', 'blue', 'green', 'black', 'gray',  
             'yellow', 'cyan', 'magenta', 'orange', ]
-    app.my_color_index = 0
+    state.my_color_index = 0
 
 def onMousePress(mouseX: int, mouseY: int) -> None:
     """This function automatically detects mouse presses.
 
     It will run once each time the mouse is pressed."""
-    # Create a new Circle each time the user clicks.
-    app.clicked_dots.append(Circle(mouseX, mouseY, 10, fill='green'))
+    app.inputs.mouse_press(mouseX, mouseY)
 
 def onMouseMove(mouseX: int, mouseY: int) -> None:
     """This function automatically updates any time the mouse moves.
 
     It will run continuously as the mouse moves."""
-    app.cursor.centerX = mouseX
-    app.cursor.centerY = mouseY
+    app.inputs.mouse_move(mouseX, mouseY)
 
 def onKeyPress(key: str) -> None:
     """This function automatically detects if a key on the keyboard was pressed.
 
     The variable key tells you which was pressed."""
-    if key:
-        if app.my_color_index < len(app.my_colors) - 1:
-            app.my_color_index += 1
-        else:
-            app.my_color_index = 0
-        app.background = app.my_colors[app.my_color_index]
+    app.inputs.key_press(key)
+
+def onStep():
+    handle_input(app, app.inputs.drain())
+
+def onAppStop():
+    app.inputs.close()
+
+def handle_input(state, frame_input) -> None:
+    """Everything one frame of input does, see input_queue.FrameInput."""
+    if frame_input.clicks:
+        add_dots(state, frame_input.clicks)
+    if frame_input.move is not None:
+        state.cursor.centerX, state.cursor.centerY = frame_input.move
+    if frame_input.move is not None or frame_input.clicks:
+        hover(state, state.cursor.centerX, state.cursor.centerY)
+    if frame_input.keys:
+        # Each key moves on to the next color, wrapping around at the end
+        state.my_color_index += sum(frame_input.keys.values())
+        state.my_color_index %= len(state.my_colors)
+        state.background = state.my_colors[state.my_color_index]
+
+def add_dots(state, clicks: list) -> None:
+    """Leave a Circle behind for each click."""
+    # Dots that would be reused again in the same frame are never seen
+    clicks = clicks[-state.max_dots:]
+    # Make room for all of them at once, oldest dots first
+    extra = len(state.clicked_dots) + len(clicks) - state.max_dots
+    for i in range(max(extra, 0)):
+        dot = state.clicked_dots.pop_oldest()
+        if dot is state.hovered:
+            dot.fill = 'green'
+            state.hovered = None
+        state.dot_pool.release(dot)
+    for x, y in clicks:
+        dot = state.dot_pool.acquire(x, y)
+        # A reused Circle is still where it was before
+        dot.centerX = x
+        dot.centerY = y
+        state.clicked_dots.add(x, y, dot)
+
+def hover(state, x: float, y: float) -> None:
+    """Color the dot under (x, y), and only that one."""
+    dot = state.clicked_dots.nearest(x, y, max_distance=10)
+    if dot is state.hovered:
+        return
+    if state.hovered is not None:
+        state.hovered.fill = 'green'
+    if dot is not None:
+        dot.fill = 'yellow'
+    state.hovered = dot
+
+def headless_state() -> SimpleNamespace:
+    """Everything start() sets up, with plain objects instead of shapes."""
+    state = SimpleNamespace(background='white')
+    start(state, lambda x, y: SimpleNamespace(centerX=x, centerY=y,
+                                              fill='green'),
+          SimpleNamespace(centerX=0, centerY=0, fill='red'))
+    return state
+
+def replay_file(path: str) -> None:
+    """Play a recording back without a window, as fast as possible."""
+    state = headless_state()
+    events = list(read_input(path))
+    start_time = time.perf_counter()
+    frames = replay(events, lambda frame_input: handle_input(state, frame_input),
+                    limit=state.max_dots)
+    seconds = time.perf_counter() - start_time
+    print(f"{len(events)} events in {frames} frames took {seconds:.3f} s, "
+          f"{len(state.clicked_dots)} dots, background {state.background}")
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Mouse and keyboard demo.")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="play a recording back without a window")
+    args = parser.parse_args()
+    if args.replay is not None:
+        replay_file(args.replay)
+        return
+    graphics.load(globals())
+    setup()
+    cmu_graphics.run()
 
-setup()
-cmu_graphics.run()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""Load cmu_graphics only when a window is actually wanted.
+
+Importing cmu_graphics is slow and sets up a whole app, which headless
+tools, tests and worker processes don't need.  So the modules that draw
+don't import it at the top.  Their main() calls load() first, which does
+the same as `from cmu_graphics import *` for the module:
+
+    def main():
+        graphics.load(globals())
+        setup()
+        cmu_graphics.run()
+
+    if __name__ == "__main__":
+        main()
+"""
+import importlib
+
+
+def load(namespace: dict) -> None:
+    """Put every name cmu_graphics exports into namespace, e.g. globals()."""
+    cmu_graphics = importlib.import_module("cmu_graphics")
+    for name in cmu_graphics.__all__:
+        namespace[name] = getattr(cmu_graphics, name)
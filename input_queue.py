@@ -0,0 +1,143 @@
+"""Collect mouse and keyboard events as they come, handle them once a frame.
+
+The mouse can send hundreds of move events between two frames, and only
+the last one decides where the cursor is drawn.  So the event functions
+don't do the work themselves, they just put the event in an InputQueue:
+
+    def onMouseMove(mouseX, mouseY):
+        app.inputs.mouse_move(mouseX, mouseY)
+
+    def onStep():
+        handle_input(app, app.inputs.drain())
+
+drain() hands over one frame's worth of input: only the last mouse move,
+the clicks in the order they came, and how many times each key was
+pressed.  With limit set, only the last limit clicks are kept, so however
+many events come in, one frame never has more than that to handle.  Key
+presses are only counted, so none of them are ever lost.
+
+Every event can also be written to a file as it comes, and played back
+later with replay(), without a window and as fast as the handler goes.
+A recording is a text file with one event per line:
+
+    frame kind x y      e.g. "12 move 100 240" or "12 press 5 5"
+    frame key name      e.g. "13 key space"
+"""
+from collections import deque
+
+
+class FrameInput:
+    """Everything that happened between two frames.
+
+    move: where the mouse moved to last, or None if it didn't move.
+    clicks: [(x, y), ...] of every mouse press, oldest first.
+    keys: {key: times pressed}, in the order first pressed.
+    events: how many events came in, before any were merged or dropped.
+    """
+    def __init__(self, move, clicks: list, keys: dict, events: int):
+        self.move = move
+        self.clicks = clicks
+        self.keys = keys
+        self.events = events
+
+
+class InputQueue:
+    """Events waiting for the next frame.
+
+    limit: most clicks kept per frame, None for no limit.
+    record: file name to write every event to, or None.
+    """
+    def __init__(self, limit: int = None, record: str = None):
+        if limit is not None and limit < 1:
+            err_str = f"Can't keep {limit} clicks per frame. "
+            err_str += "Use a limit of at least 1, or None for no limit."
+            raise ValueError(err_str)
+        self.limit = limit
+        self.frame = 0
+        self.move = None
+        self.clicks = deque(maxlen=limit)
+        self.keys = {}
+        self.events = 0
+        # Totals: moves merged into a later one, clicks over limit
+        self.merged = 0
+        self.dropped = 0
+        self.file = open(record, "w") if record is not None else None
+
+    def mouse_move(self, x: float, y: float) -> None:
+        if self.move is not None:
+            self.merged += 1
+        self.move = (x, y)
+        self.events += 1
+        if self.file is not None:
+            self.file.write(f"{self.frame} move {x} {y}\n")
+
+    def mouse_press(self, x: float, y: float) -> None:
+        if len(self.clicks) == self.limit:
+            self.dropped += 1
+        self.clicks.append((x, y))
+        self.events += 1
+        if self.file is not None:
+            self.file.write(f"{self.frame} press {x} {y}\n")
+
+    def key_press(self, key: str) -> None:
+        self.keys[key] = self.keys.get(key, 0) + 1
+        self.events += 1
+        if self.file is not None:
+            self.file.write(f"{self.frame} key {key}\n")
+
+    def drain(self) -> FrameInput:
+        """This frame's input, and start collecting for the next frame."""
+        frame_input = FrameInput(self.move, list(self.clicks), self.keys,
+                                 self.events)
+        self.move = None
+        self.clicks.clear()
+        self.keys = {}
+        self.events = 0
+        self.frame += 1
+        return frame_input
+
+    def close(self) -> None:
+        """Stop recording."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def read_input(path: str):
+    """Yield (frame, kind, values) for every event in a recording.
+
+    values is (x, y) for "move" and "press", (name,) for "key".
+    """
+    with open(path) as file:
+        for line in file:
+            frame, kind, rest = line.rstrip("\n").split(" ", 2)
+            if kind == "key":
+                yield int(frame), kind, (rest,)
+            else:
+                x, y = rest.split()
+                yield int(frame), kind, (_number(x), _number(y))
+
+
+def _number(text: str):
+    return float(text) if "." in text else int(text)
+
+
+def replay(events, handle, limit: int = None) -> int:
+    """Feed recorded events through an InputQueue, frame by frame.
+
+    events are (frame, kind, values) in order, e.g. from read_input().
+    handle(frame_input) is called once for every frame, with no waiting in
+    between.  Returns the number of frames handled.
+    """
+    queue = InputQueue(limit)
+    add = {"move": queue.mouse_move, "press": queue.mouse_press,
+           "key": queue.key_press}
+    frames = 0
+    for frame, kind, values in events:
+        # Frames before this event are over, handle them
+        while queue.frame < frame:
+            handle(queue.drain())
+            frames += 1
+        add[kind](*values)
+    handle(queue.drain())
+    return frames + 1
@@ -0,0 +1,151 @@
+"""Timings, counters and histograms for the simulations.
+
+Every simulation has a Stats object.  It is off by default, and then costs
+almost nothing: phase() hands back a do-nothing context manager and the
+other methods return right away.  Hot loops check stats.enabled themselves
+so they don't even pay for the method call.
+
+    sim = RoadSim(stats=Stats(enabled=True, report_every=800))
+
+Every report_every frames a summary is written, either printed or appended
+to a file.  Events, like two cars on top of each other, go to the same
+place as they happen.
+"""
+import json
+import math
+import time
+
+
+class _NoPhase:
+    """What phase() returns when Stats is off: a context manager that does
+    nothing at all."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NO_PHASE = _NoPhase()
+
+
+class _Phase:
+    """Times one run of a phase and adds it to the totals."""
+    __slots__ = ("stats", "name", "start")
+
+    def __init__(self, stats: "Stats", name: str):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Stats:
+    """Collects what happens in a simulation, and reports it now and then.
+
+    enabled: collect timings, counters and histograms at all.
+    report_every: write a summary every this many frames, 0 for never.
+    path: append summaries and events to this file instead of printing.
+    """
+    def __init__(self, enabled: bool = False, report_every: int = 0,
+                 path: str = None):
+        self.enabled = enabled
+        self.report_every = report_every
+        self.path = path
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget everything collected so far."""
+        # name -> [total seconds, number of times]
+        self.times = {}
+        self.counters = {}
+        # name -> {bucket: count}, see observe()
+        self.histograms = {}
+
+    def phase(self, name: str):
+        """Context manager that times the code inside it as phase name."""
+        if not self.enabled:
+            return _NO_PHASE
+        return _Phase(self, name)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        """Add seconds to phase name, for code timed by hand."""
+        if not self.enabled:
+            return
+        entry = self.times.get(name)
+        if entry is None:
+            self.times[name] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def count(self, name: str, n: int = 1) -> None:
+        """Add n to counter name."""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, value: float) -> None:
+        """Add value to histogram name.
+
+        Buckets double in size: bucket 0 holds values below 1, bucket 1
+        holds 1 up to 2, bucket 2 holds 2 up to 4, bucket 3 holds 4 up to 8,
+        and so on.
+        """
+        if not self.enabled:
+            return
+        bucket = 0 if value < 1 else int(math.log2(value)) + 1
+        histogram = self.histograms.setdefault(name, {})
+        histogram[bucket] = histogram.get(bucket, 0) + 1
+
+    def event(self, message: str) -> None:
+        """Something worth knowing about right away, e.g. a crash."""
+        self.count("events")
+        self._write(message)
+
+    def frame_done(self, frame: int) -> None:
+        """Call at the end of each frame, writes the summary when it's due."""
+        if self.report_every and frame % self.report_every == 0:
+            self._write(self.summary(frame))
+
+    def as_dict(self) -> dict:
+        return {
+            "times": {name: {"seconds": total, "calls": calls}
+                      for name, (total, calls) in self.times.items()},
+            "counters": dict(self.counters),
+            "histograms": {name: {str(bucket): n for bucket, n in
+                                  sorted(histogram.items())}
+                           for name, histogram in self.histograms.items()},
+        }
+
+    def summary(self, frame: int) -> str:
+        """Everything collected so far, as readable text."""
+        lines = [f"Frame {frame}"]
+        for name, (total, calls) in self.times.items():
+            lines.append(f"  {name}: {1000 * total:.1f} ms in {calls} calls, "
+                         f"{1000 * total / calls:.3f} ms each")
+        for name, value in self.counters.items():
+            lines.append(f"  {name}: {value}")
+        for name, histogram in self.histograms.items():
+            buckets = []
+            for bucket, n in sorted(histogram.items()):
+                low = 0 if bucket == 0 else 2 ** (bucket - 1)
+                buckets.append(f"{low}-{2 ** bucket}: {n}")
+            lines.append(f"  {name}: " + ", ".join(buckets))
+        return "\n".join(lines)
+
+    def dump(self, path: str) -> None:
+        """Save everything collected so far as JSON."""
+        with open(path, "w") as file:
+            json.dump(self.as_dict(), file, indent=2)
+
+    def _write(self, text: str) -> None:
+        if self.path is None:
+            print(text)
+        else:
+            with open(self.path, "a") as file:
+                file.write(text + "\n")
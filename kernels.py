@@ -0,0 +1,135 @@
+"""Inner loops as plain functions over arrays, compiled when Numba is there.
+
+With Numba installed (pip install numba), the functions here are compiled
+to machine code the first time they run, and the compiled code is cached on
+disk in __pycache__, so later runs start fast.  Without Numba they are
+ordinary Python functions working on lists, which still beats looking up
+attributes on objects in the innermost loop.
+
+    python kernels.py
+
+checks that the kernels move the particles exactly like LoopEngine.
+
+The road passes in road_sim.py (move, near checks, adjust) have no kernel
+yet.  A sequential loop is no problem, loop_push() is one, but a kernel
+needs the state in arrays, and every car keeps its state in its own Car
+object: position, speed and lane, plus a set of the car ids it is stuck
+behind.  The road would first need an array snapshot of the cars, sorted
+by lane, for a kernel to work on.
+"""
+import math
+
+try:
+    import numba
+    import numpy as np
+except ImportError:
+    # Everything works without them, just slower
+    numba = None
+    np = None
+
+HAVE_NUMBA = numba is not None
+
+
+def njit(function):
+    """Compile function with Numba if possible, else leave it as it is."""
+    if HAVE_NUMBA:
+        return numba.njit(cache=True)(function)
+    return function
+
+
+def to_array(values: list, kind: type = float):
+    """values in whatever form the kernels work on fastest."""
+    if HAVE_NUMBA:
+        return np.array(values, dtype=kind)
+    return list(values)
+
+
+@njit
+def loop_push(x, y, c, stuck, edge_pos, edge_is_x, edge_c, width, height):
+    """One frame of LoopEngine.step(), on arrays instead of objects.
+
+    x, y, c and stuck hold every particle's position, repel constant and
+    stuck counter, and are changed in place.  The edges are given the same
+    way: where they are, whether that's an x (or a y) and their repel
+    constant.  Returns how many particles were unstuck from an edge.
+
+    Two particles at the exact same place need random numbers, which are
+    not available here.  Then -1 is returned, the arrays are half done and
+    the caller has to do this frame some other way.
+    """
+    n = len(x)
+    resets = 0
+    for i in range(n):
+        px = x[i]
+        py = y[i]
+        ci = c[i]
+        # Every edge pushes, straight away from itself
+        for e in range(len(edge_pos)):
+            if edge_is_x[e]:
+                px += edge_c[e] * ci / (px - edge_pos[e])
+            else:
+                py += edge_c[e] * ci / (py - edge_pos[e])
+        # Every other particle pushes, the ones before i already moved
+        for j in range(n):
+            if j == i:
+                continue
+            sx = x[j]
+            sy = y[j]
+            distance = math.sqrt((sx - px)**2 + (sy - py)**2)
+            if distance == 0:
+                return -1
+            x_repel = c[j] * (px - sx) / distance
+            y_repel = c[j] * (py - sy) / distance
+            px += x_repel
+            py += y_repel
+        # Same as particle_engines.keep_on_screen()
+        if px < 0:
+            px = 2.0
+        elif px > width:
+            px = width - 2.0
+        if py < 0:
+            py = 2.0
+        elif py > height:
+            py = height - 2.0
+        if (int(px) == 2 or int(px) == width - 2 or
+                int(py) == 2 or int(py) == height - 2):
+            stuck[i] += 1
+        else:
+            stuck[i] = 0
+        if stuck[i] > 4:
+            stuck[i] = 0
+            resets += 1
+            if px == 2:
+                px = 50.0
+            elif px == width - 2:
+                px = width - 50.0
+            if py == 2:
+                py = 50.0
+            elif py == height - 2:
+                py = height - 50.0
+        x[i] = px
+        y[i] = py
+    return resets
+
+
+def main():
+    """Check that JitEngine moves particles just like LoopEngine."""
+    from particle_sim import ParticleSim
+
+    print("Numba:", "yes" if HAVE_NUMBA else "no, plain Python")
+    for particles, frames in ((15, 200), (100, 50), (300, 10)):
+        reference = ParticleSim(particles, engine="loop", seed=particles)
+        compiled = ParticleSim(particles, engine="jit", seed=particles)
+        for frame in range(frames):
+            reference.step()
+            compiled.step()
+        largest = max(max(abs(a.x - b.x), abs(a.y - b.y))
+                      for a, b in zip(reference.moving(), compiled.moving()))
+        same_stuck = all(a.stuck == b.stuck for a, b in
+                         zip(reference.moving(), compiled.moving()))
+        print(f"{particles} particles, {frames} frames: "
+              f"largest difference {largest:.2g} pixels")
+        assert largest < 1e-6 and same_stuck, "JitEngine differs from loop"
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Cars of each lane kept sorted by x, to find nearby cars quickly.
+
+Without an index, "is anyone in my lane within NEAR_TEST of me" means
+looking at every car on the road.  With every lane sorted by x, it is two
+binary searches (bisect) in one short list.
+"""
+from bisect import bisect_left, bisect_right
+
+
+class SortedCars:
+    """Cars sorted by their x position, with the x values kept alongside."""
+    def __init__(self):
+        self.xs = []
+        self.cars = []
+
+    def __len__(self) -> int:
+        return len(self.cars)
+
+    def insert(self, x: float, car) -> None:
+        i = bisect_right(self.xs, x)
+        self.xs.insert(i, x)
+        self.cars.insert(i, car)
+
+    def _find(self, x: float, car) -> int:
+        # Several cars can have the same x, look for the right one
+        i = bisect_left(self.xs, x)
+        while self.cars[i] is not car:
+            i += 1
+        return i
+
+    def remove(self, x: float, car) -> None:
+        i = self._find(x, car)
+        del self.xs[i]
+        del self.cars[i]
+
+    def move(self, old_x: float, new_x: float, car) -> None:
+        """Change the x of car, which is filed under old_x."""
+        i = self._find(old_x, car)
+        xs = self.xs
+        # Usually cars don't pass each other in one frame, so the order stays
+        #   the same and only the x value needs to change.
+        if ((i == 0 or xs[i - 1] <= new_x) and
+                (i == len(xs) - 1 or new_x <= xs[i + 1])):
+            xs[i] = new_x
+        else:
+            del xs[i]
+            del self.cars[i]
+            self.insert(new_x, car)
+
+    def between(self, low: float, high: float) -> list:
+        """Cars with low < x < high, sorted by x."""
+        start = bisect_right(self.xs, low)
+        stop = bisect_left(self.xs, high, start)
+        return self.cars[start:stop]
+
+
+class LaneIndex:
+    """Every car, filed by lane and sorted by x.
+
+    Cars that are in the middle of changing lanes have a lane number like
+    1.35.  They are filed under that exact number, so they only match cars
+    with the exact same number, the same as comparing car.lane == lane.
+    They are also kept in a separate list, see changing_between().
+
+    Call update(car) whenever a car's x, lane or changing_lanes changes.
+    """
+    def __init__(self):
+        self.lanes = {}
+        self.changing = SortedCars()
+        # Where each car is filed: (lane, x, changing_lanes)
+        self.placed = {}
+
+    def __len__(self) -> int:
+        return len(self.placed)
+
+    def __contains__(self, car) -> bool:
+        return car in self.placed
+
+    def add(self, car) -> None:
+        lane = self.lanes.get(car.lane)
+        if lane is None:
+            lane = self.lanes[car.lane] = SortedCars()
+        lane.insert(car.x, car)
+        if car.changing_lanes:
+            self.changing.insert(car.x, car)
+        self.placed[car] = (car.lane, car.x, car.changing_lanes)
+
+    def remove(self, car) -> None:
+        lane, x, changing = self.placed.pop(car)
+        cars = self.lanes[lane]
+        cars.remove(x, car)
+        if not cars:
+            # Don't keep lists around for all the in-between lane numbers
+            del self.lanes[lane]
+        if changing:
+            self.changing.remove(x, car)
+
+    def update(self, car) -> None:
+        """File car again if it moved, changed lanes or started changing."""
+        lane, x, changing = self.placed[car]
+        if lane != car.lane or changing != car.changing_lanes:
+            self.remove(car)
+            self.add(car)
+        elif x != car.x:
+            self.lanes[lane].move(x, car.x, car)
+            if changing:
+                self.changing.move(x, car.x, car)
+            self.placed[car] = (lane, car.x, changing)
+
+    def between(self, lane: float, low: float, high: float) -> list:
+        """Cars in lane with low < x < high, sorted by x."""
+        cars = self.lanes.get(lane)
+        if cars is None:
+            return []
+        return cars.between(low, high)
+
+    def changing_between(self, low: float, high: float) -> list:
+        """Cars changing lanes with low < x < high, sorted by x."""
+        return self.changing.between(low, high)
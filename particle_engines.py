@@ -0,0 +1,644 @@
+"""Force engines for the particle simulation in particles.py.
+
+An engine owns the job of moving every particle for one frame.  All engines
+share the same small interface:
+
+    engine.add(particle)   # start simulating a new particle
+    engine.step()          # move every particle by one frame
+
+The first four items of objs are always the four Edge walls, the rest are
+Particle objects.  Engines only read and write particle.x, particle.y and
+particle.stuck, so drawing the circles is left to particles.py.  Random
+numbers come from particle.rng, so a seeded simulation repeats exactly.
+"""
+import math
+import multiprocessing
+import os
+import random
+import threading
+import weakref
+from multiprocessing import shared_memory
+
+import kernels
+from quadtree import QuadTree
+from spatial_grid import SpatialGrid
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is only needed by NumpyEngine, the loop engine works without it
+    np = None
+
+
+def keep_on_screen(particle, width: int, height: int) -> bool:
+    """Put an off-screen particle back on, and unstick it from the edges.
+
+    Returns True if the particle had to be unstuck.
+    """
+    # If a particle ends up off-screen, put it back on
+    if particle.x < 0:
+        particle.x = 2
+    elif particle.x > width:
+        particle.x = width - 2
+    if particle.y < 0:
+        particle.y = 2
+    elif particle.y > height:
+        particle.y = height - 2
+    # Sometimes a particle gets stuck at the edge
+    if (int(particle.x) == 2 or
+            int(particle.x) == width - 2 or
+            int(particle.y) == 2 or
+            int(particle.y) == height - 2
+    ):
+        particle.stuck += 1
+    else:
+        particle.stuck = 0
+    if particle.stuck > 4:
+        particle.stuck = 0
+        if particle.x == 2:
+            particle.x = 50
+        elif particle.x == width - 2:
+            particle.x = width - 50
+        if particle.y == 2:
+            particle.y = 50
+        elif particle.y == height - 2:
+            particle.y = height - 50
+        return True
+    return False
+
+
+def push_tile(x, y, c, edges: list, start: int, stop: int, rng_of) -> tuple:
+    """New positions of particles start to stop-1 after a frame of pushes.
+
+    x, y and c are the positions and repel constants of every particle at the
+    start of the frame.  rng_of(j) gives the random numbers for particle j,
+    they are only needed if two particles are at the exact same place.  This
+    is the NumPy part of NumpyEngine and ParallelEngine.
+    """
+    new_x = x[start:stop].copy()
+    new_y = y[start:stop].copy()
+    tile_c = c[start:stop]
+    # Edges push straight away from themselves, closer => stronger
+    with np.errstate(divide="ignore"):
+        for edge in edges:
+            if edge.x is not None:
+                new_x += edge.repel_const * tile_c / (new_x - edge.x)
+            else:
+                new_y += edge.repel_const * tile_c / (new_y - edge.y)
+    # Then particle j pushes every particle in the tile, all of them at once
+    for j, (x_j, y_j, c_j) in enumerate(zip(x.tolist(), y.tolist(),
+                                            c.tolist())):
+        dx = new_x - x_j
+        dy = new_y - y_j
+        distance = np.hypot(dx, dy)
+        # A particle doesn't push itself
+        if start <= j < stop:
+            distance[j - start] = np.inf
+        if not distance.all():
+            # Really unlikely that distance == 0, but avoid a crash if so
+            rng = rng_of(j)
+            for i in np.flatnonzero(distance == 0):
+                new_x[i] += rng.randrange(1, 10)
+                new_y[i] += rng.randrange(1, 10)
+                distance[i] = np.inf
+        new_x += c_j * dx / distance
+        new_y += c_j * dy / distance
+    return new_x, new_y
+
+
+class LoopEngine:
+    """The original engine: every object repels every particle, one at a time.
+
+    Particles are moved in order, and each push is applied as soon as it is
+    computed.  So a particle later in the list already sees the new position
+    of the particles before it.  This is the reference the other engines are
+    compared against.
+    """
+    def __init__(self, objs: list, width: int, height: int):
+        self.objs = objs
+        self.width = width
+        self.height = height
+        # How many times a particle was unstuck from an edge, for the stats
+        self.stuck_resets = 0
+
+    def add(self, particle) -> None:
+        self.objs.append(particle)
+
+    def step(self) -> None:
+        # The first four items are non-moving walls, so don't move them.
+        for particle in self.objs[4:]:
+            # But all objects other than itself repel each particle
+            for obj in self.objs:
+                if obj != particle:
+                    repel = obj.repel(particle)
+                    particle.x += repel[0]
+                    particle.y += repel[1]
+            if keep_on_screen(particle, self.width, self.height):
+                self.stuck_resets += 1
+
+
+class JitEngine(LoopEngine):
+    """LoopEngine's pushes, done by the compiled kernel in kernels.py.
+
+    The particles are copied into arrays at the start of each frame and
+    back at the end, and kernels.loop_push() does the rest.  Without Numba
+    the kernel is plain Python, still faster than LoopEngine.  The results
+    are the same as LoopEngine's, which kernels.py checks.  If two
+    particles are at the exact same place, the frame is done by LoopEngine
+    instead, since the kernel has no random numbers.
+    """
+    def __init__(self, objs: list, width: int, height: int):
+        super().__init__(objs, width, height)
+        edges = objs[:4]
+        self.edge_pos = kernels.to_array(
+            [edge.x if edge.x is not None else edge.y for edge in edges])
+        self.edge_is_x = kernels.to_array(
+            [edge.x is not None for edge in edges], bool)
+        self.edge_c = kernels.to_array([edge.repel_const for edge in edges])
+
+    def step(self) -> None:
+        particles = self.objs[4:]
+        x = kernels.to_array([p.x for p in particles])
+        y = kernels.to_array([p.y for p in particles])
+        c = kernels.to_array([p.repel_const for p in particles])
+        stuck = kernels.to_array([p.stuck for p in particles], int)
+        resets = kernels.loop_push(x, y, c, stuck, self.edge_pos,
+                                   self.edge_is_x, self.edge_c,
+                                   self.width, self.height)
+        if resets < 0:
+            # The particles themselves haven't moved yet
+            super().step()
+            return
+        self.stuck_resets += resets
+        for particle, new_x, new_y, new_stuck in zip(
+            particles, list(x), list(y), list(stuck)
+        ):
+            particle.x = float(new_x)
+            particle.y = float(new_y)
+            particle.stuck = int(new_stuck)
+
+
+class NumpyEngine:
+    """Move all the particles at once with NumPy arrays.
+
+    Positions, repel constants and stuck counters live in arrays, and the
+    Particle objects are only updated at the end of each step so that
+    particles.py can move the circles.
+
+    Each particle still gets its pushes one after another in the same order
+    as LoopEngine (edges first, then the other particles), and moves after
+    each push.  What changes is that the pushing particles are always at the
+    place they were at the start of the frame, since every particle is moved
+    at the same time, so this is not the same as LoopEngine's one by one
+    update.  How far apart one frame from the same positions ends up
+    depends on how hard the particles push:
+
+    - In the first frames from random positions the pushes are big, and a
+      particle can end up tens of pixels away from where LoopEngine puts
+      it: up to about 6 pixels with 15 particles, 15 with 100 and 90 with
+      300.
+    - After 20 frames that is down to about 1 pixel with 100 particles
+      and 5 with 300.
+    - Once the particles have spread out (100 frames or so) the two engines
+      agree to within 0.25 pixels per particle per frame, and 0.05 with
+      15 particles.
+
+    Over many frames the runs drift apart, the same way two runs with
+    different random starts do.  python particle_engines.py checks these
+    numbers.
+    """
+    def __init__(self, objs: list, width: int, height: int):
+        if np is None:
+            raise ImportError("NumpyEngine needs numpy, try: pip install numpy")
+        self.objs = objs
+        self.edges = objs[:4]
+        self.width = width
+        self.height = height
+        self.particles = list(objs[4:])
+        self.x = np.array([p.x for p in self.particles], dtype=float)
+        self.y = np.array([p.y for p in self.particles], dtype=float)
+        self.repel_const = np.array(
+            [p.repel_const for p in self.particles], dtype=float
+        )
+        self.stuck = np.array([p.stuck for p in self.particles], dtype=int)
+        self.stuck_resets = 0
+
+    def add(self, particle) -> None:
+        self.objs.append(particle)
+        self.particles.append(particle)
+        self.x = np.append(self.x, float(particle.x))
+        self.y = np.append(self.y, float(particle.y))
+        self.repel_const = np.append(self.repel_const, particle.repel_const)
+        self.stuck = np.append(self.stuck, particle.stuck)
+
+    def push(self) -> tuple:
+        """New positions of every particle after all the pushes of a frame."""
+        return push_tile(self.x, self.y, self.repel_const, self.edges,
+                         0, len(self.particles),
+                         lambda j: self.particles[j].rng)
+
+    def keep_on_screen(self) -> None:
+        """Same as keep_on_screen(), but for all particles at once."""
+        x, y, w, h = self.x, self.y, self.width, self.height
+        x[x < 0] = 2
+        x[x > w] = w - 2
+        y[y < 0] = 2
+        y[y > h] = h - 2
+        ix = np.trunc(x)
+        iy = np.trunc(y)
+        at_edge = (ix == 2) | (ix == w - 2) | (iy == 2) | (iy == h - 2)
+        self.stuck = np.where(at_edge, self.stuck + 1, 0)
+        free = self.stuck > 4
+        self.stuck[free] = 0
+        self.stuck_resets += int(free.sum())
+        x[free & (x == 2)] = 50
+        x[free & (x == w - 2)] = w - 50
+        y[free & (y == 2)] = 50
+        y[free & (y == h - 2)] = h - 50
+
+    def step(self) -> None:
+        self.x, self.y = self.push()
+        self.keep_on_screen()
+        # Copy the results back to the Particle objects
+        for particle, x, y, stuck in zip(
+            self.particles, self.x.tolist(), self.y.tolist(),
+            self.stuck.tolist()
+        ):
+            particle.x = x
+            particle.y = y
+            particle.stuck = stuck
+
+
+# Rows of ParallelEngine's shared buffer
+_X, _Y, _C, _NEW_X, _NEW_Y = range(5)
+
+
+def _shared_arrays(shm, capacity: int):
+    """The five rows of a ParallelEngine buffer, as NumPy arrays."""
+    return np.ndarray((5, capacity), dtype=float, buffer=shm.buf)
+
+
+def _tile(n: int, workers: int, k: int) -> tuple:
+    """The particles worker k looks after, as (start, stop)."""
+    return k * n // workers, (k + 1) * n // workers
+
+
+def _parallel_worker(name: str, capacity: int, control, barrier,
+                     edges: list, workers: int, k: int) -> None:
+    """What each ParallelEngine worker process runs until told to stop."""
+    shm = shared_memory.SharedMemory(name=name)
+    arrays = _shared_arrays(shm, capacity)
+    try:
+        while True:
+            barrier.wait()
+            # control is [number of particles, frame], -1 particles = stop
+            n, frame = control[0], control[1]
+            if n < 0:
+                break
+            start, stop = _tile(n, workers, k)
+            try:
+                # Each tile gets its own random numbers, the same every run
+                rng = random.Random(f"{frame} {start}")
+                new_x, new_y = push_tile(arrays[_X, :n], arrays[_Y, :n],
+                                         arrays[_C, :n], edges, start, stop,
+                                         lambda j: rng)
+                arrays[_NEW_X, start:stop] = new_x
+                arrays[_NEW_Y, start:stop] = new_y
+            except BaseException:
+                # Wake everybody up instead of leaving them waiting forever
+                barrier.abort()
+                raise
+            barrier.wait()
+    finally:
+        del arrays
+        shm.close()
+
+
+def _stop_workers(processes: list, control, barrier, shm) -> None:
+    """Tell the workers to quit, wait for them and free the buffer."""
+    # A worker killed while waiting at the barrier would make the barrier
+    #   hang, so only use it if they're all still there
+    if all(process.is_alive() for process in processes):
+        control[0] = -1
+        try:
+            barrier.wait(timeout=5)
+        except threading.BrokenBarrierError:
+            pass
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+    shm.close()
+    shm.unlink()
+
+
+class ParallelEngine(NumpyEngine):
+    """NumpyEngine with the particles split into tiles, one per process.
+
+    Positions and repel constants go into a shared_memory buffer that every
+    worker process can see, so nothing is pickled from frame to frame.  Each
+    frame the workers meet at a barrier, push the particles of their own
+    tile (see push_tile()) and write the new positions back into the
+    buffer, then meet at the barrier again.  The result is the same as
+    NumpyEngine, down to the last bit.  The one exception is two particles
+    at the exact same place: a worker can't use particle.rng, so it nudges
+    them with its own seeded random numbers.
+
+    Every worker still loops in Python over every pushing particle, only
+    for fewer targets, so that part of the work does not shrink as workers
+    are added.  How much faster more workers are has not been measured on
+    more than one core: run benchmark.py, which has a
+    particles-10k-parallel-N scenario for each power of two up to the
+    number of cores.
+
+    If a worker dies, step() raises RuntimeError after timeout seconds
+    instead of waiting forever.  Call close() to stop the workers, or leave
+    it to garbage collection.
+    """
+    def __init__(self, objs: list, width: int, height: int,
+                 workers: int = None, timeout: float = 60):
+        super().__init__(objs, width, height)
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.frames = 0
+        self._stop = None
+        self._start(max(64, 2 * len(self.particles)))
+
+    def _start(self, capacity: int) -> None:
+        """Start the workers with room for capacity particles."""
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(create=True,
+                                              size=5 * capacity * 8)
+        self.arrays = _shared_arrays(self.shm, capacity)
+        # Plain shared integers, workers only read them after the barrier
+        self.control = multiprocessing.RawArray("q", 2)
+        self.barrier = multiprocessing.Barrier(self.workers + 1)
+        self.processes = []
+        for k in range(self.workers):
+            process = multiprocessing.Process(
+                target=_parallel_worker,
+                args=(self.shm.name, capacity, self.control, self.barrier,
+                      self.edges, self.workers, k),
+                daemon=True,
+            )
+            process.start()
+            self.processes.append(process)
+        self._stop = weakref.finalize(self, _stop_workers, self.processes,
+                                      self.control, self.barrier, self.shm)
+
+    def close(self) -> None:
+        """Stop the worker processes and free the shared buffer."""
+        self.arrays = None
+        if self._stop is not None:
+            self._stop()
+
+    def add(self, particle) -> None:
+        super().add(particle)
+        if len(self.particles) > self.capacity:
+            # Out of room: start over with a buffer twice as big
+            self.close()
+            self._start(2 * self.capacity)
+
+    def push(self) -> tuple:
+        n = len(self.particles)
+        arrays = self.arrays
+        arrays[_X, :n] = self.x
+        arrays[_Y, :n] = self.y
+        arrays[_C, :n] = self.repel_const
+        self.control[0] = n
+        self.control[1] = self.frames
+        self.frames += 1
+        # Once to let the workers go, once to wait until they're all done
+        try:
+            if not all(process.is_alive() for process in self.processes):
+                raise threading.BrokenBarrierError
+            self.barrier.wait(self.timeout)
+            self.barrier.wait(self.timeout)
+        except threading.BrokenBarrierError:
+            self.close()
+            err_str = "ParallelEngine workers stopped responding. "
+            err_str += "One of them died or raised an error."
+            raise RuntimeError(err_str) from None
+        return arrays[_NEW_X, :n].copy(), arrays[_NEW_Y, :n].copy()
+
+
+class GridEngine:
+    """Like LoopEngine, but particles only push neighbors within a cutoff.
+
+    Particles are filed in a SpatialGrid with cells as big as the cutoff, so
+    each particle only looks at the particles in the 3x3 block of cells
+    around it.  Edges still push every particle.
+
+    Careful: the push does not fade with distance, a particle pushes with
+    the same strength (repel_const) however far away it is.  So the pushes
+    that get dropped are as big as the ones that are kept, and any finite
+    cutoff changes the results.  In an even field they mostly cancel out,
+    near the walls they don't.  Turn on report_error to measure how much
+    push is lost.
+
+    Not even a cutoff bigger than the window is safe: in the middle of a
+    frame the edges can fling a particle tens of thousands of pixels off
+    screen before keep_on_screen() brings it back.  Only cutoff=None, which
+    keeps every pair and skips the grid, matches LoopEngine exactly.
+    """
+    def __init__(self, objs: list, width: int, height: int,
+                 cutoff: float = 200, report_error: bool = False):
+        self.objs = objs
+        self.edges = objs[:4]
+        self.width = width
+        self.height = height
+        self.cutoff = cutoff
+        self.report_error = report_error
+        # Mean and largest push lost per particle in the last frame
+        self.error = (0.0, 0.0)
+        self.stuck_resets = 0
+        self.particles = []
+        self.grid = None
+        if cutoff is not None:
+            self.grid = SpatialGrid(width, height, cutoff)
+        for particle in objs[4:]:
+            self._file(particle)
+
+    def _file(self, particle) -> None:
+        if self.grid is not None:
+            self.grid.insert(len(self.particles), particle.x, particle.y)
+        self.particles.append(particle)
+
+    def add(self, particle) -> None:
+        self.objs.append(particle)
+        self._file(particle)
+
+    def neighbors(self, i: int) -> list:
+        """Indices of the particles within the cutoff of particle i."""
+        if self.grid is None:
+            return [j for j in range(len(self.particles)) if j != i]
+        particle = self.particles[i]
+        near = []
+        for j in self.grid.near(particle.x, particle.y):
+            if j != i and dist(self.particles[j], particle) <= self.cutoff:
+                near.append(j)
+        # Keep the same order LoopEngine pushes in
+        near.sort()
+        return near
+
+    def measure_error(self) -> tuple:
+        """Compare this frame's pushes with the pushes from all particles.
+
+        Returns the mean and the largest size of the push each particle does
+        not get because of the cutoff.  This checks every pair, so it is as
+        slow as LoopEngine.
+        """
+        lost = []
+        for i, particle in enumerate(self.particles):
+            near = set(self.neighbors(i))
+            x_lost = y_lost = 0.0
+            for j, other in enumerate(self.particles):
+                if j != i and j not in near and dist(other, particle) > 0:
+                    repel = other.repel(particle)
+                    x_lost += repel[0]
+                    y_lost += repel[1]
+            lost.append(math.hypot(x_lost, y_lost))
+        if not lost:
+            return 0.0, 0.0
+        return sum(lost) / len(lost), max(lost)
+
+    def step(self) -> None:
+        if self.report_error:
+            self.error = self.measure_error()
+        for i, particle in enumerate(self.particles):
+            for edge in self.edges:
+                repel = edge.repel(particle)
+                particle.x += repel[0]
+                particle.y += repel[1]
+            for j in self.neighbors(i):
+                repel = self.particles[j].repel(particle)
+                particle.x += repel[0]
+                particle.y += repel[1]
+            if keep_on_screen(particle, self.width, self.height):
+                self.stuck_resets += 1
+            if self.grid is not None:
+                self.grid.move(i, particle.x, particle.y)
+
+
+class BarnesHutEngine:
+    """Keep every push, but lump far-away particles together in a quadtree.
+
+    The tree is rebuilt from the positions at the start of each frame.  Each
+    particle then gets the edge pushes, followed by the pushes from the
+    QuadTree one after another, moving after each one just like LoopEngine.
+    theta is the opening angle: 0 gives every pair one by one, 0.5 is a good
+    balance, bigger is faster and rougher.
+
+    Running quadtree.py checks that at theta = 0.5 the total push on every
+    particle is within 2% of an average push.  Frame by frame the particles
+    end up a few pixels away from where LoopEngine puts them, because a
+    lumped far square pushes all at once instead of bit by bit.  With
+    theta = 0 the result matches NumpyEngine.
+    """
+    def __init__(self, objs: list, width: int, height: int,
+                 theta: float = 0.5):
+        self.objs = objs
+        self.edges = objs[:4]
+        self.width = width
+        self.height = height
+        self.theta = theta
+        self.stuck_resets = 0
+
+    def add(self, particle) -> None:
+        self.objs.append(particle)
+
+    def step(self) -> None:
+        particles = self.objs[4:]
+        tree = QuadTree([p.x for p in particles], [p.y for p in particles],
+                        [p.repel_const for p in particles])
+        for i, particle in enumerate(particles):
+            for edge in self.edges:
+                repel = edge.repel(particle)
+                particle.x += repel[0]
+                particle.y += repel[1]
+            for x, y, mass in tree.interactions(particle.x, particle.y,
+                                                self.theta, skip=i):
+                distance = math.hypot(particle.x - x, particle.y - y)
+                if distance > 0:
+                    particle.x += mass * (particle.x - x) / distance
+                    particle.y += mass * (particle.y - y) / distance
+                else:
+                    # Really unlikely that distance == 0, but avoid a crash
+                    particle.x += particle.rng.randrange(1, 10)
+                    particle.y += particle.rng.randrange(1, 10)
+            if keep_on_screen(particle, self.width, self.height):
+                self.stuck_resets += 1
+
+
+def dist(obj1, obj2) -> float:
+    """Usual Pythagorean distance, assuming obj1 and obj2 have attrs .x & .y"""
+    return math.sqrt((obj1.x - obj2.x)**2 + (obj1.y - obj2.y)**2)
+
+
+ENGINES = {
+    "loop": LoopEngine,
+    "jit": JitEngine,
+    "numpy": NumpyEngine,
+    "parallel": ParallelEngine,
+    "grid": GridEngine,
+    "barnes-hut": BarnesHutEngine,
+}
+
+
+def make_engine(name: str, objs: list, width: int, height: int, **options):
+    """Create the engine called name, e.g. "loop" or "numpy".
+
+    Any options are passed on to the engine, e.g. cutoff for "grid" or
+    theta for "barnes-hut".
+    """
+    if name not in ENGINES:
+        err_str = f"Unknown engine {name!r}. "
+        err_str += "Choose one of: " + ", ".join(ENGINES)
+        raise ValueError(err_str)
+    return ENGINES[name](objs, width, height, **options)
+
+
+def frame_difference(particles: int, warmup: int, seed: int) -> tuple:
+    """Median and largest distance between LoopEngine and NumpyEngine.
+
+    Both engines take one frame from the same positions, reached by running
+    LoopEngine for warmup frames first.
+    """
+    import copy
+    import statistics
+    from particle_sim import ParticleSim
+
+    sim = ParticleSim(particles, engine="loop", seed=seed)
+    for i in range(warmup):
+        sim.step()
+    loop_objs = copy.deepcopy(sim.objs)
+    numpy_objs = copy.deepcopy(sim.objs)
+    LoopEngine(loop_objs, sim.width, sim.height).step()
+    NumpyEngine(numpy_objs, sim.width, sim.height).step()
+    distances = [math.dist((a.x, a.y), (b.x, b.y))
+                 for a, b in zip(loop_objs[4:], numpy_objs[4:])]
+    return statistics.median(distances), max(distances)
+
+
+def main():
+    """Check the bounds NumpyEngine's docstring promises."""
+    # (particles, frames run before comparing, median and largest difference
+    #   allowed).  Measured for seeds 0 to 2, plus about half again, so a
+    #   small change in how NumpyEngine pushes already fails.
+    checks = [
+        (15, 0, 5, 10), (100, 0, 10, 25), (300, 0, 20, 50),
+        (300, 5, 60, 100),
+        (100, 20, 0.25, 1), (300, 20, 1, 6),
+        (15, 100, 0.01, 0.05), (100, 100, 0.025, 0.1), (300, 100, 0.05, 0.25),
+    ]
+    for particles, warmup, median_bound, bound in checks:
+        for seed in range(3):
+            median, largest = frame_difference(particles, warmup, seed)
+            print(f"{particles} particles after {warmup} frames, seed {seed}: "
+                  f"median {median:.3f}, largest {largest:.3f} pixels")
+            assert median < median_bound and largest < bound, (
+                f"NumpyEngine differs by {median:.3f} (median), "
+                f"{largest:.3f} (largest)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""The particle simulation without any graphics.
+
+particles.py draws this simulation in a cmu_graphics window, but everything
+here also runs without a window, e.g. for tests or batch jobs:
+
+    sim = ParticleSim(particles=100, seed=1)
+    for i in range(1000):
+        sim.step()
+"""
+import random
+
+from instrument import Stats
+from particle_engines import dist, make_engine
+
+
+class ParticleSim:
+    """Everything the particle simulation knows, and how to advance it."""
+    def __init__(self, particles: int = 15, width: int = 840,
+                 height: int = 840, engine: str = "loop", seed: int = None,
+                 stats: Stats = None, **engine_options):
+        # All random choices come from here, so the same seed gives the
+        #   same run every time.  No seed means a different run every time.
+        self.rng = random.Random(seed)
+        # Timings and counters, off unless asked for.  Reports the frame
+        #   number every 300 frames either way.
+        self.stats = stats if stats is not None else Stats(report_every=300)
+        # Number of particles, new particles are made with this in mind
+        self.particles = particles
+        self.width = width
+        self.height = height
+        self.edge_repel = 1000 + 50*particles
+        self.frames = 0
+        # The first four items are the walls, the rest are Particle objects
+        self.objs = []
+        self.objs.append(Edge(x = 0, repel_const = self.edge_repel))
+        self.objs.append(Edge(x = width, repel_const = self.edge_repel))
+        self.objs.append(Edge(y = 0, repel_const = self.edge_repel))
+        self.objs.append(Edge(y = height, repel_const = self.edge_repel))
+        for i in range(particles):
+            x = self.rng.randrange(1, width)
+            y = self.rng.randrange(1, height)
+            self.objs.append(Particle(x, y, particles, self.rng))
+        # Kept so a checkpoint can make the same engine again
+        self.engine_name = engine
+        self.engine_options = engine_options
+        self.engine = make_engine(engine, self.objs, width, height,
+                                  **engine_options)
+
+    def moving(self) -> list:
+        """All the Particle objects, without the walls."""
+        return self.objs[4:]
+
+    def add_particle(self, x: int, y: int) -> "Particle":
+        """Add a new particle at (x, y), e.g. where the mouse was clicked."""
+        particle = Particle(x, y, self.particles, self.rng)
+        self.engine.add(particle)
+        self.particles += 1
+        return particle
+
+    def step(self) -> None:
+        """Calculate new position of each particle for one frame."""
+        stats = self.stats
+        resets = self.engine.stuck_resets
+        with stats.phase("engine step"):
+            self.engine.step()
+        self.frames += 1
+        stats.count("stuck resets", self.engine.stuck_resets - resets)
+        stats.frame_done(self.frames)
+
+
+class Particle(object):
+    """A particle is a freely moving object that repels all other particles"""
+    def __init__(self, x: int, y: int, particles: int, rng=random):
+        self.x = x
+        self.y = y
+        # The more particles there are, the weaker each one pushes
+        self.repel_const = (20 + particles) / particles
+        self.stuck = 0
+        # Where to get random numbers, normally the simulation's generator
+        self.rng = rng
+
+    def repel(self, other: "Edge | Particle") -> (float, float):
+        # Apply the repelling force of a particle, closer => stronger
+        distance = dist(self, other)
+        if distance > 0:
+            x_repel = self.repel_const * (other.x - self.x) / distance
+            y_repel = self.repel_const * (other.y - self.y) / distance
+        else:
+            # Really unlikely that distance == 0, but avoid a crash if so
+            x_repel = self.rng.randrange(1,10)
+            y_repel = self.rng.randrange(1,10)
+        return x_repel, y_repel
+
+
+class Edge(object):
+    """ An Edge is literally the edge of the screen. """
+    def __init__(self, x: int = None, y: int = None,
+                 repel_const: float = 1750):
+    # We expect to get x or y, but not both so we made x,y optional arguments
+        # Crash the program if we got neither x,y or both
+        if x is None and y is None:
+            err_str = "Can't create Edge instance with no coordinate given. "
+            err_str += "Provide either an x or a y coordinate."
+            raise ValueError(err_str)
+        if x is not None and y is not None:
+            err_str = "Can't create Edge instance with both coordinate given. "
+            err_str += "Provide either an x or a y coordinate."
+            raise ValueError(err_str)
+        # Whichever was not passed in will be None, that was the default value
+        self.x = x
+        self.y = y
+        self.repel_const = repel_const
+
+    def repel(self, other: Particle) -> (float, float):
+        # Apply the repelling force on a particle, perpendicular to the edge
+        # Force is proportional to reciprocal of distance, so closer => stronger
+        if self.x is not None:
+            return self.repel_const * other.repel_const / (other.x - self.x), 0
+        elif self.y is not None:
+            return 0, self.repel_const * other.repel_const / (other.y - self.y)
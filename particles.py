@@ -1,132 +1,152 @@
-from random import randrange
-import math
 import inspect
 
-from cmu_graphics import *
+import graphics
+from checkpoint import load_checkpoint, save_checkpoint
+from instrument import Stats
+from render import ShapeSync
+from scheduler import FixedStep
+from shape_pool import ShapePool
+from particle_sim import ParticleSim
+from sim_trace import (PARTICLE_RECORD, ParticleReplay, TraceWriter,
+                       particle_records)
+from telemetry import PARTICLE_TABLES, TelemetrySink, record_particles
 
-app.particles = 15
-app.edge_repel = 1000 + 50*app.particles
-app.frames = 0
+# The simulation itself lives in particle_sim.py, this file only draws it.
+#   cmu_graphics is only loaded by main(), see graphics.py.
+
+def settings():
+    """Everything you might want to change before a run."""
+    app.particles = 15
+    # Clicking adds particles up to this many, each one needs its own Circle
+    app.max_particles = 1000
+    # Which force engine moves the particles: "loop" (original), "numpy",
+    #   "jit", "parallel", "grid" or "barnes-hut"
+    app.engine_name = "loop"
+    # Extra settings for the engine, e.g.
+    #   {"cutoff": 150, "report_error": True}
+    app.engine_options = {}
+    # Seed for the random numbers, None means a different run every time
+    app.seed = None
+    # File name to record every frame to, or None
+    app.record = None
+    # File name of a recording to play back instead of simulating, or None
+    app.replay = None
+    # Pressing s saves the simulation here, and if resume is a file name the
+    #   simulation carries on from that checkpoint instead of starting fresh
+    #   (see checkpoint.py)
+    app.checkpoint_path = "particles.ckpt"
+    app.resume = None
+    # File name to stream every particle of every frame to, or None.  Read
+    #   it back with telemetry.read_telemetry().
+    app.telemetry_path = None
+    # Timings and counters, e.g. Stats(enabled=True, report_every=300).
+    #   Switched off it still prints the frame number every 300 frames.
+    app.stats = Stats(report_every=300)
 
 def setup():
     """Run this before the simulation starts to get things going."""
     app.width = 840
     app.height = 840
     app.background = "black"
-    app.objs = []
-    app.objs.append(Edge(x = 0))
-    app.objs.append(Edge(x = app.width))
-    app.objs.append(Edge(y = 0))
-    app.objs.append(Edge(y = app.height))
-    for i in range(app.particles):
-        x = randrange(1, app.width)
-        y = randrange(1, app.height)
-        app.objs.append(Particle(x, y))
-    
+    if app.replay is not None:
+        app.sim = ParticleReplay(app.replay)
+    elif app.resume is not None:
+        app.sim = load_checkpoint(app.resume, stats=app.stats)
+    else:
+        app.sim = ParticleSim(app.particles, app.width, app.height,
+                              app.engine_name, app.seed, stats=app.stats,
+                              **app.engine_options)
+    app.trace = None
+    if app.record is not None:
+        app.trace = TraceWriter(app.record, PARTICLE_RECORD)
+    app.telemetry = None
+    if app.telemetry_path is not None:
+        app.telemetry = TelemetrySink(app.telemetry_path, PARTICLE_TABLES)
+    # The simulation runs this many steps per second of real time, no
+    #   matter how fast the frames get drawn (see scheduler.py)
+    app.sim_rate = 30
+    app.scheduler = FixedStep(step_sim, steps_per_second=app.sim_rate)
+    # One Circle for each particle, looked up by its place in
+    #   app.sim.moving().  Circles are drawn at whole pixels, so a particle
+    #   that moves less than a pixel doesn't need its circle moved.
+    app.circle_pool = ShapePool(make_circle, capacity=app.max_particles)
+    app.circles = ShapeSync(app.circle_pool,
+                            centerX=lambda particle: rounded(particle.x),
+                            centerY=lambda particle: rounded(particle.y))
+    draw_circles()
+
+def make_circle(particle) -> "Circle":
+    """Create the Circle that shows a particle."""
+    circle = Circle(particle.x, particle.y, 25)
+    circle.fill = "white"
+    return circle
+
 def onStep():
-    """Calculate new position of each particle for each frame."""
-    # The first four items are non-moving walls, so don't move them.
-    for particle in app.objs[4:]:
-        # But all objects other than itself repel each particle
-        for obj in app.objs:
-            if obj != particle:
-                repel = obj.repel(particle)
-                particle.x += repel[0]
-                particle.y += repel[1]
-        # If a particle ends up off-screen, put it back on
-        if particle.x < 0:
-            particle.x = 2
-        elif particle.x > app.width:
-            particle.x = app.width - 2
-        if particle.y < 0:
-            particle.y = 2
-        elif particle.y > app.height:
-            particle.y = app.height - 2
-        # Sometimes a particle gets stuck at the edge
-        if (int(particle.x) == 2 or 
-                int(particle.x) == app.width - 2 or
-                int(particle.y) == 2 or
-                int(particle.y) == app.height - 2
-        ):
-            particle.stuck += 1
-        else:
-            particle.stuck = 0
-        if particle.stuck > 4:
-            particle.stuck = 0
-            if particle.x == 2:
-                particle.x = 50
-            elif particle.x == app.width - 2:
-                particle.x = app.width - 50
-            if particle.y == 2:
-                particle.y = 50
-            elif particle.y == app.height - 2:
-                particle.y = app.height - 50
-        particle.circle.centerX = particle.x
-        particle.circle.centerY = particle.y
-    app.frames += 1
-    if app.frames % 30 == 0:
-        for particle in app.objs[4:]:
-            print(f"{particle.x:3.0f}, {particle.y:3.0f}", end="  ")
-        print()
+    """Calculate new position of each particle for each frame.
 
-def onMousePress(mouseX: int, mouseY: int) -> None:
-    """Add a new particle when we get a click."""
-    app.objs.append(Particle(mouseX, mouseY))
-    app.particles += 1
-    print(app.particles, end="  ")
+    The simulation may take several steps, or none, depending on how much
+    time passed since the last frame.
+    """
+    steps = app.scheduler.advance()
+    if app.scheduler.render_due(steps):
+        with app.stats.phase("shapes"):
+            draw_circles()
+
+def step_sim() -> None:
+    """One step of the simulation, and its recording."""
+    app.sim.step()
+    if app.trace is not None:
+        app.trace.write_frame(app.sim.frames, particle_records(app.sim))
+    if app.telemetry is not None:
+        record_particles(app.telemetry, app.sim)
+    if app.sim.frames % 30 == 0 and getattr(app.sim.engine, "report_error",
+                                            False):
+        mean, largest = app.sim.engine.error
+        app.stats.event(f"Push lost to cutoff: mean {mean:.2f}, "
+                        f"largest {largest:.2f}")
 
-class Particle(object):
-    """A particle is a freely moving object that repels all other particles"""
-    def __init__(self, x: int, y: int):
-        self.x = x
-        self.y = y
-        self.repel_const = (20 + app.particles) / app.particles
-        self.stuck = 0
-        self.circle = Circle(self.x, self.y, 25)
-        self.circle.fill = "white"
+def draw_circles() -> None:
+    """The simulation only moves the particles, move the circles to match.
 
-    def repel(self, other: "Edge | Particle") -> (float, float):
-        # Apply the repelling force of a particle, closer => stronger
-        distance = dist(self, other)
-        if distance > 0:
-            x_repel = self.repel_const * (other.x - self.x) / distance
-            y_repel = self.repel_const * (other.y - self.y) / distance
-        else:
-            # Really unlikely that distance == 0, but avoid a crash if so
-            x_repel = randrange(1,10)
-            y_repel = randrange(1,10)
-        return x_repel, y_repel
+    Particles added since the last frame get a new circle.
+    """
+    for i, particle in enumerate(app.sim.moving()):
+        app.circles.sync(i, particle)
 
-class Edge(object):
-    """ An Edge is literally the edge of the screen. """
-    def __init__(self, x: int = None, y: int = None):
-    # We expect to get x or y, but not both so we made x,y optional arguments
-        # Crash the program if we got neither x,y or both
-        if x is None and y is None:
-            err_str = "Can't create Edge instance with no coordinate given. "
-            err_str += "Provide either an x or a y coordinate."
-            raise ValueError(err_str)
-        if x is not None and y is not None:
-            err_str = "Can't create Edge instance with both coordinate given. "
-            err_str += "Provide either an x or a y coordinate."
-            raise ValueError(err_str)
-        # Whichever was not passed in will be None, that was the default value
-        self.x = x
-        self.y = y
-        self.repel_const = app.edge_repel   
+def onMousePress(mouseX: int, mouseY: int) -> None:
+    """Add a new particle when we get a click."""
+    # A recording can't be changed while it plays back
+    if app.replay is not None:
+        return
+    if len(app.sim.moving()) >= app.max_particles:
+        app.stats.event(f"Already {app.max_particles} particles, "
+                        f"not adding more")
+        return
+    app.sim.add_particle(mouseX, mouseY)
+    app.stats.count("particles added")
 
-    def repel(self, other: Particle) -> (float, float):
-        # Apply the repelling force on a particle, perpendicular to the edge
-        # Force is proportional to reciprocal of distance, so closer => stronger
-        if self.x is not None:
-            return self.repel_const * other.repel_const / (other.x - self.x), 0
-        elif self.y is not None:
-            return 0, self.repel_const * other.repel_const / (other.y - self.y)
+def onKeyPress(key: str) -> None:
+    """Press s to save a checkpoint of the simulation."""
+    if key == 's' and app.replay is None:
+        save_checkpoint(app.sim, app.checkpoint_path)
+        print(f"Saved frame {app.sim.frames} to {app.checkpoint_path}")
 
-def dist(obj1: Particle, obj2: Particle) -> float:
-    """Usual Pythagorean distance, assuming obj1 and obj2 have attrs .x & .y"""
-    return math.sqrt((obj1.x - obj2.x)**2 + (obj1.y - obj2.y)**2)
+def onAppStop():
+    """Make sure the whole recording gets written when the window closes."""
+    if app.trace is not None:
+        app.trace.close()
+    if app.telemetry is not None:
+        dropped = app.telemetry.close()
+        if dropped:
+            app.stats.event(f"Telemetry dropped {dropped} rows, "
+                            "the disk was too slow")
 
+def main():
+    """Open the window and run the simulation."""
+    graphics.load(globals())
+    settings()
+    setup()
+    cmu_graphics.run()
 
-setup()
-cmu_graphics.run()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
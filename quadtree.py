@@ -0,0 +1,185 @@
+"""Barnes-Hut quadtree for the pushes between particles.
+
+Far away, a whole group of particles pushes about the same as one big
+particle sitting at the group's center of mass.  The quadtree splits the
+world into squares, then each square into 4 smaller squares, and so on, and
+remembers the total repel constant ("mass") and center of mass of each.
+
+To find the push on a particle we walk down the tree.  A square that looks
+small from where the particle is (its size / distance is less than theta)
+is treated as one big particle, otherwise we look inside it.  theta = 0 is
+exact and slow, bigger theta is faster but rougher.
+
+Run this file to check the approximation against the exact sum on seeded
+random layouts.
+"""
+import math
+import random
+
+
+class _Node:
+    """One square of the tree."""
+    __slots__ = ("left", "top", "size", "mass", "x", "y", "order", "children",
+                 "points")
+
+    def __init__(self, left: float, top: float, size: float):
+        self.left = left
+        self.top = top
+        self.size = size
+        # Total repel constant, and center of mass (x, y)
+        self.mass = 0.0
+        self.x = 0.0
+        self.y = 0.0
+        # Average index of the points inside, see QuadTree.interactions()
+        self.order = 0.0
+        # Either 4 smaller squares, or the indices of the points inside
+        self.children = None
+        self.points = None
+
+    def contains(self, x: float, y: float) -> bool:
+        return (self.left <= x <= self.left + self.size and
+                self.top <= y <= self.top + self.size)
+
+
+class QuadTree:
+    """Quadtree over points xs[i], ys[i] that each push with masses[i]."""
+    def __init__(self, xs: list, ys: list, masses: list,
+                 leaf_size: int = 8, max_depth: int = 32):
+        self.xs = list(xs)
+        self.ys = list(ys)
+        self.masses = list(masses)
+        self.leaf_size = leaf_size
+        self.max_depth = max_depth
+        if self.xs:
+            left, top = min(self.xs), min(self.ys)
+            size = max(max(self.xs) - left, max(self.ys) - top) + 1
+        else:
+            left = top = 0
+            size = 1
+        self.root = self._build(list(range(len(self.xs))), left, top, size, 0)
+
+    def _build(self, points: list, left: float, top: float, size: float,
+               depth: int) -> _Node:
+        node = _Node(left, top, size)
+        mass = mx = my = 0.0
+        for i in points:
+            m = self.masses[i]
+            mass += m
+            mx += m * self.xs[i]
+            my += m * self.ys[i]
+        node.mass = mass
+        if mass > 0:
+            node.x = mx / mass
+            node.y = my / mass
+        if points:
+            node.order = sum(points) / len(points)
+        # Few enough points (or squares too small to split): keep them all
+        if len(points) <= self.leaf_size or depth == self.max_depth:
+            node.points = points
+            return node
+        half = size / 2
+        mid_x = left + half
+        mid_y = top + half
+        quarters = [[], [], [], []]
+        for i in points:
+            quarters[(self.xs[i] >= mid_x) + 2 * (self.ys[i] >= mid_y)].append(i)
+        node.children = []
+        for n, quarter in enumerate(quarters):
+            if quarter:
+                child_left = mid_x if n % 2 else left
+                child_top = mid_y if n >= 2 else top
+                node.children.append(
+                    self._build(quarter, child_left, child_top, half, depth + 1)
+                )
+        return node
+
+    def interactions(self, x: float, y: float, theta: float,
+                     skip: int = None) -> list:
+        """Everything that pushes a particle at (x, y), as (x, y, mass).
+
+        Far squares come back as one entry at their center of mass, near
+        points come back one by one.  skip is the index of the particle
+        itself, so it doesn't push itself.
+
+        The list is in index order (a far square counts as the average index
+        of its points), the same order the original loop pushes in.  That
+        matters when the pushes are applied one at a time.
+        """
+        terms = []
+        if skip is not None:
+            skip_x, skip_y = self.xs[skip], self.ys[skip]
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.points is not None:
+                for i in node.points:
+                    if i != skip:
+                        terms.append(
+                            (i, self.xs[i], self.ys[i], self.masses[i])
+                        )
+                continue
+            distance = math.hypot(node.x - x, node.y - y)
+            # Never lump a particle in with the square it is in itself
+            holds_skip = skip is not None and node.contains(skip_x, skip_y)
+            if not holds_skip and node.size < theta * distance:
+                terms.append((node.order, node.x, node.y, node.mass))
+            else:
+                stack.extend(node.children)
+        terms.sort()
+        return [term[1:] for term in terms]
+
+    def push(self, x: float, y: float, theta: float, skip: int = None) -> tuple:
+        """Total push on a particle at (x, y), all from that one spot."""
+        x_push = y_push = 0.0
+        for other_x, other_y, mass in self.interactions(x, y, theta, skip):
+            distance = math.hypot(x - other_x, y - other_y)
+            if distance > 0:
+                x_push += mass * (x - other_x) / distance
+                y_push += mass * (y - other_y) / distance
+        return x_push, y_push
+
+
+def exact_push(xs: list, ys: list, masses: list, i: int) -> tuple:
+    """Total push on point i from every other point, one pair at a time."""
+    x_push = y_push = 0.0
+    for j, (x, y, mass) in enumerate(zip(xs, ys, masses)):
+        distance = math.hypot(xs[i] - x, ys[i] - y)
+        if j != i and distance > 0:
+            x_push += mass * (xs[i] - x) / distance
+            y_push += mass * (ys[i] - y) / distance
+    return x_push, y_push
+
+
+def push_error(n: int, theta: float, seed: int, size: int = 840) -> float:
+    """Largest push error on a seeded random layout of n particles.
+
+    The error is measured in units of one average push, i.e. the average
+    size of the exact total push on a particle.
+    """
+    rng = random.Random(seed)
+    xs = [rng.uniform(0, size) for i in range(n)]
+    ys = [rng.uniform(0, size) for i in range(n)]
+    masses = [(20 + n) / n] * n
+    tree = QuadTree(xs, ys, masses)
+    errors = []
+    sizes = []
+    for i in range(n):
+        exact = exact_push(xs, ys, masses, i)
+        approx = tree.push(xs[i], ys[i], theta, skip=i)
+        errors.append(math.hypot(exact[0] - approx[0], exact[1] - approx[1]))
+        sizes.append(math.hypot(*exact))
+    return max(errors) / (sum(sizes) / n)
+
+
+def main():
+    # The error bound we promise for theta = 0.5
+    bound = 0.02
+    for n in (100, 500, 2000):
+        for seed in range(3):
+            error = push_error(n, 0.5, seed)
+            print(f"n = {n:4d}, seed {seed}: largest error {error:.4f}")
+            assert error < bound, f"Barnes-Hut error {error:.4f} > {bound}"
+    print(f"All errors are below {bound} of an average push.")
+
+if __name__ == "__main__":
+    main()
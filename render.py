@@ -0,0 +1,87 @@
+"""Keep cmu_graphics shapes in step with the simulation, writing only changes.
+
+Setting a property on a cmu_graphics shape is slow compared to the
+simulation itself, and most frames most properties don't change: a car that
+drives at my speed stays at the same x, colors hardly ever change.  A
+ShapeSync remembers what it last wrote to each shape and only writes the
+properties that are different now:
+
+    rects = ShapePool(lambda car: Rect(car.x, car.y, 80, 50))
+    cars = ShapeSync(rects, left=lambda car: car.x, top=lambda car: car.y,
+                     fill=lambda car: car.color)
+    for car in sim.cars.values():
+        cars.sync(car.id, car)
+
+Nothing here imports cmu_graphics, the shapes come from a ShapePool.
+"""
+from shape_pool import ShapePool
+
+
+class ShapeSync:
+    """One shape per entity, looked up by a key such as the car id.
+
+    Shapes come from pool, which calls its make_shape(entity) for new ones.
+    Every keyword argument is a shape property, with a function that gives
+    its value for an entity.  on_new(shape), if given, runs once for every
+    shape that is newly made or reused, e.g. to send it to the back.  It is
+    never needed again after that, so z-order calls like toBack() don't
+    have to happen every frame.
+
+    When the pool is full, sync() draws nothing and returns None, and tries
+    again next time.
+    """
+    def __init__(self, pool: ShapePool, on_new=None, **properties):
+        self.pool = pool
+        self.on_new = on_new
+        self.names = tuple(properties)
+        self.getters = tuple(properties.values())
+        # key -> shape
+        self.shapes = {}
+        # key -> property values last written to its shape
+        self.written = {}
+        # How many property writes were done and how many were skipped
+        self.writes = 0
+        self.skipped = 0
+
+    def __len__(self) -> int:
+        return len(self.shapes)
+
+    def sync(self, key, entity):
+        """Update the shape of entity, getting one if needed, and return it."""
+        values = tuple(get(entity) for get in self.getters)
+        shape = self.shapes.get(key)
+        if shape is None:
+            shape = self._new_shape(key, entity)
+            if shape is None:
+                return None
+            old = (None,) * len(values)
+        else:
+            old = self.written[key]
+            if old == values:
+                # The usual case: nothing changed, nothing to write
+                self.skipped += len(values)
+                return shape
+        for name, value, old_value in zip(self.names, values, old):
+            if value != old_value:
+                setattr(shape, name, value)
+                self.writes += 1
+            else:
+                self.skipped += 1
+        self.written[key] = values
+        return shape
+
+    def release(self, key) -> None:
+        """The entity is gone, give its shape back to the pool."""
+        shape = self.shapes.pop(key, None)
+        if shape is not None:
+            self.pool.release(shape)
+            del self.written[key]
+
+    def _new_shape(self, key, entity):
+        shape = self.pool.acquire(entity)
+        if shape is None:
+            return None
+        self.shapes[key] = shape
+        if self.on_new is not None:
+            self.on_new(shape)
+        return shape
@@ -1,36 +1,79 @@
-from random import randrange
+import graphics
+from checkpoint import load_checkpoint, save_checkpoint
+from instrument import Stats
+from render import ShapeSync
+from shape_pool import ShapePool
+from road_sim import RoadSim
+from scheduler import FixedStep
+from sim_trace import ROAD_RECORD, RoadReplay, TraceWriter, road_records
+from telemetry import ROAD_TABLES, TelemetrySink, record_road
+from traffic_stats import TrafficStats
 
-from cmu_graphics import *
+# The simulation itself lives in road_sim.py, this file only draws it.
+#   cmu_graphics is only loaded by main(), see graphics.py.
 
 def setup():
     """Create objects and constants, set up the window for the simulation."""
-    # Following distance of one car to another.  1 car length = 80 pixels
-    app.NEAR_TEST = 240
     # Number of lanes in my road
     app.lanes = 3
+    # Seed for the random numbers, None means a different run every time
+    app.seed = None
+    # File name to record every frame to, or None
+    app.record = None
+    # File name of a recording to play back instead of simulating, or None
+    app.replay = None
+    # Pressing s saves the simulation here, and if resume is a file name
+    #   the simulation carries on from that checkpoint instead of starting
+    #   fresh (see checkpoint.py)
+    app.checkpoint_path = "road.ckpt"
+    app.resume = None
+    # Timings and counters, e.g. Stats(enabled=True, report_every=800).
+    #   Switched off it still prints the frame number every 800 frames.
+    app.stats = Stats(report_every=800)
+    # File name to stream every car of every frame to, or None.  Read it
+    #   back with telemetry.read_telemetry().
+    app.telemetry_path = None
+    app.telemetry = None
+    if app.telemetry_path is not None:
+        app.telemetry = TelemetrySink(app.telemetry_path, ROAD_TABLES)
+    # Flow, density, speeds and more over the last 300 frames, kept up to
+    #   date as the cars move.  Press t to print them.
+    app.traffic = TrafficStats(window=300)
+    if app.replay is not None:
+        app.sim = RoadReplay(app.replay, app.lanes)
+    elif app.resume is not None:
+        app.sim = load_checkpoint(app.resume, stats=app.stats,
+                                  telemetry=app.telemetry,
+                                  traffic=app.traffic)
+    else:
+        app.sim = RoadSim(app.lanes, seed=app.seed, stats=app.stats,
+                          telemetry=app.telemetry, traffic=app.traffic)
+    app.trace = None
+    if app.record is not None:
+        app.trace = TraceWriter(app.record, ROAD_RECORD)
+    # The simulation runs this many steps per second of real time, no
+    #   matter how fast the frames get drawn (see scheduler.py)
+    app.sim_rate = 30
+    app.scheduler = FixedStep(step_sim, steps_per_second=app.sim_rate)
+    # Cars removed by all the steps since the cars were last drawn
+    app.removed_cars = []
     # Size of the window showing the road.  Height depends on # of lanes
-    app.width = 1200
-    app.height = 100*app.lanes + 100
+    app.width = app.sim.width
+    app.height = app.sim.height
     # Set background to dark gray
     app.background = 'dimGray'
-    # Counting frames drawn so we can generate new traffic on a schedule
-    app.frames = 0
-    # List of all cars on the road, excluding me
-    app.cars = []
-    # List of removed cars.  This is to avoid creating new Rect() objects 
-    #   when creating new Car() objects so as to avoid the maxShape limit
-    #   in cmu_graphics.
-    app.removed_cars = []
-    # Any global variables to be modified have to be declared here
-    app.me = MyCar(0)
-    for i in range(randrange(2, 5*app.lanes)):
-        car = generate_new_car()
-        if car is not None:
-            app.cars.append(car)
-        else:
-            pass
-            # print("Could not fit a car, too many collisions.")
-    # print(app.cars)
+    # Rects of removed cars are hidden and reused for new cars, so as to
+    #   avoid the maxShape limit in cmu_graphics.  Cars beyond the capacity
+    #   are simulated but not drawn.
+    app.rect_pool = ShapePool(lambda car: Rect(car.x, car.y, 80, 50),
+                              capacity=1000)
+    # The Rect drawn for each car, looked up by car id.  Only properties
+    #   that changed since the last frame get written.  Each new Rect goes
+    #   to the back once, so my car (drawn first) stays in front.
+    app.rects = ShapeSync(app.rect_pool, on_new=lambda rect: rect.toBack(),
+                          left=lambda car: car.x, top=lambda car: car.y,
+                          fill=lambda car: car.color)
+    draw_cars()
     app.road = Road()
     app.road.create_road()
 
@@ -39,56 +82,58 @@ def onStep():
     """This function runs once per frame. 
     
     Update positions of all objects, create new objects as needed, destroy 
-    objects no longer in use.
+    objects no longer in use.  The simulation may take several steps, or
+    none, depending on how much time passed since the last frame.
     """
-    app.frames += 1
-    app.road.shift_lane_lines()
-    # Draw my car, adjust as needed
-    app.me.move_car()
-    app.me.check_near()
-    app.me.check_speeds()
-    # Draw and adjust other cars
-    for i, car in enumerate(app.cars):
-        car.move_car()
-        near = car.check_near()
-        # prevent things getting static by randomly nudging speed by a bit
-        if not near and car != app.me:
-            adj = randrange(-5, 6)
-            car.speed += 0.001 * adj
-            car.previous_speed += 0.001 * adj
-        car.rect.fill = car.color
-        car.rect.toBack()
-    # Check who's far enough off-screen that they're not coming on-screen
-    purge_cars()
-    # Every once in a while, add a new car
-    if app.frames % 160 == 0:
-        car = generate_new_car()
-        if car is not None:
-            app.cars.append(car)
-        else:
-            pass
-            # print("Could not fit a car, too many collisions.\n")
-        # If needed, print car stats
-        my_str = str(len(app.cars))
-        on_screen = 0
-        for car in app.cars:
-            if -80 < car.x < app.width:
-                on_screen += 1
-            for other_car in app.cars:
-                if car != other_car:
-                    if (abs(car.x - other_car.x) < 80
-                            and car.lane == other_car.lane):
-                        disaster_str = f"Disaster at {car.x}, {other_car.x}!\n"
-                        disaster_str += f"Now: {app.frames} "
-                        disaster_str += f"Car 1: {car.frame_created} "
-                        disaster_str += f"Car 2: {other_car.frame_created}" 
-                        print(disaster_str)
-        my_str += "," + str(on_screen)
-        for car in app.cars:
-            my_str += "\t" + str(car.lane) + "," + str(int(car.x))
-        # print(my_str)
-        if app.frames % 800 == 0:
-            print(app.frames)
+    steps = app.scheduler.advance()
+    with app.stats.phase("lane lines"):
+        app.road.shift_lane_lines(steps)
+    if app.scheduler.render_due(steps):
+        with app.stats.phase("shapes"):
+            draw_cars()
+
+
+def step_sim() -> None:
+    """One step of the simulation, and its recording."""
+    app.sim.step()
+    app.removed_cars += app.sim.removed_cars
+    if app.trace is not None:
+        app.trace.write_frame(app.sim.frames, road_records(app.sim))
+    if app.telemetry is not None:
+        record_road(app.telemetry, app.sim)
+
+
+def onKeyPress(key: str) -> None:
+    """Press s to save a checkpoint of the simulation, t for traffic stats."""
+    if key == 's' and app.replay is None:
+        save_checkpoint(app.sim, app.checkpoint_path)
+        print(f"Saved frame {app.sim.frames} to {app.checkpoint_path}")
+    if key == 't' and app.replay is None:
+        for name, value in app.traffic.summary().items():
+            print(f"{name:>22}: {value:.3f}" if isinstance(value, float)
+                  else f"{name:>22}: {value}")
+
+
+def onAppStop():
+    """Make sure the whole recording gets written when the window closes."""
+    if app.trace is not None:
+        app.trace.close()
+    if app.telemetry is not None:
+        dropped = app.telemetry.close()
+        if dropped:
+            print(f"Telemetry dropped {dropped} rows, the disk was too slow")
+
+
+def draw_cars() -> None:
+    """Move each car's Rect to where the car is, and color it."""
+    rects = app.rects
+    for car in app.removed_cars:
+        rects.release(car.id)
+    app.removed_cars = []
+    me = app.sim.me
+    rects.sync(me.id, me)
+    for car in app.sim.cars.values():
+        rects.sync(car.id, car)
 
         
 class Road:
@@ -117,310 +162,38 @@ class Road:
         """Create the dashed lane lines.
         
         These lines are 125 pixels long, each one starts 300 pixels from the
-        previous one.  
+        previous one.  Each lane line is a single Line with dashes, so the
+        dashes wrap around by themselves: scrolling only moves where the
+        Line starts, however wide the road is.
         """
+        # Where the dashes start, from -300 up to (not including) 0.  The
+        #   first dash is off-screen, the second one is the leftmost visible.
+        self.scroll = -300
         self.lane_lines = []
         for i in range(app.lanes - 1):
-            for j in range(app.width // 300):
-                r = Rect(300*j, 100*i + 150, 125, 10)
-                r.fill = self.line_color
-                self.lane_lines.append(r)
+            line = Line(self.scroll, 100*i + 155, app.width, 100*i + 155,
+                        lineWidth=10, dashes=(125, 175))
+            line.fill = self.line_color
+            self.lane_lines.append(line)
 
-    def shift_lane_lines(self) -> None:
-        """Move the lane lines along, giving illusion of car movement."""
-        # All line segments need to jump 300 pixels left if minimum left 
-        #   position gets as large as 175 (= spacing - length).
-        lefts = []
-        for r in self.lane_lines:
-            r.left += 15
-            lefts.append(r.left)
-        if min(lefts) >= 175:
-            for r in self.lane_lines:
-                r.left -= 300
+    def shift_lane_lines(self, steps: int = 1) -> None:
+        """Move the lane lines along, giving illusion of car movement.
 
-    
-class Car(object):
-    """Superclass for cars in the simulation.
-    
-    Not intended to be called directly, use the classes that inherit from it."""
-    def __init__(self, lane: int):
-        """Intended to be called by all subclasses."""
-        # Used when changing lanes
-        self.changing_lanes = False
-        # Which direction we're changing: left (-1) or right (+1)
-        self.changing_lanes_dir = 0
-        # Lane Number, between 0 & lane - 1
-        self.lane = lane
-        # If you have to slow down because someone is in front of you, keep
-        # track of how fast you were going
-        self.previous_speed = self.speed
-        # Which frame number the car finished changing lanes.
-        self.changed_lanes_frame = 0
-        # self.x is set in the subclass
-        self.y = 100 * self.lane + 80
-        # Keep track on when the car was created, for error checking.
-        self.frame_created = app.frames
-        # Keep track of who this car is stuck behind. 
-        self.stuck_behind = []
-        if not app.removed_cars:
-            self.rect = Rect(self.x, self.y, 80, 50)
-        else:
-            self.rect = app.removed_cars.pop().rect
-            self.rect.left = self.x
-            self.rect.top = self.y
-        self.rect.fill = self.color
+        Lines move 15 pixels for each step the simulation took.
+        """
+        # Once the dashes moved a whole 300 pixels, they look the same as
+        #   when they started, so start over from there.
+        self.scroll = (self.scroll + 15 * steps + 300) % 300 - 300
+        for line in self.lane_lines:
+            line.x1 = self.scroll
 
-    def move_car(self) -> None:
-        """Find new correct location, both forward/back (x), and lane (y)."""
-        if self != app.me:
-            self.x += rounded(self.speed * 10)
-        else:
-            self.check_speeds()
-        if self.changing_lanes:
-            self.lane += self.changing_lanes_dir * 0.05
-            self.y = 100 * self.lane + 80
-            if abs(self.lane - rounded(self.lane)) < 0.01:
-                self.changing_lanes = False
-                self.changing_lanes_dir = 0
-                self.lane = int(rounded(self.lane))
-                self.y = 100 * self.lane + 80
-                self.changed_lanes_frame = app.frames
-                # print("Done changing lanes")
-        self.rect.left = self.x
-        self.rect.top = self.y
-        
-    def change_lanes(self, dir: int) -> None:
-        """To change lanes, just change attributes, move_car does the rest."""
-        self.changing_lanes = True
-        self.changing_lanes_dir = dir
-    
-    def check_near(self) -> bool:
-        """See if another car is near enough to change this car's behavior."""
-        near = False
-        app.cars.append(app.me)
-        for i, car in enumerate(app.cars):
-            # Avoid checking self, you're always near yourself
-            if self != car:
-                if (self.lane == car.lane and 
-                        self.x - car.x < app.NEAR_TEST and 
-                        self.x - car.x > 0
-                ):
-                    near = True
-                    near_car_index = i
-                    if i not in self.stuck_behind:
-                        self.stuck_behind.append(i)
-                    for j in app.cars[i].stuck_behind:
-                        if j not in self.stuck_behind:
-                            self.stuck_behind.append(j)
-                    
-        app.cars.pop(-1)
-        if not self.changing_lanes:
-            # Any time a car is not in the right lane, and it can go right, it
-            # should go right.
-            blocked_right = False
-            # Include me in cars that might need to get right
-            app.cars.append(app.me)
-            for car in app.cars:
-                if car != self:
-                    if (car.lane == self.lane - 1 and 
-                            abs(car.x - self.x) < app.NEAR_TEST
-                    ):
-                        blocked_right = True
-                    if (car.changing_lanes and 
-                            abs(car.x - self.x) < app.NEAR_TEST
-                    ):
-                        blocked_right = True
-            if not blocked_right and self.lane > 0 and not self.changing_lanes:
-                if app.frames > self.changed_lanes_frame + 40:
-                    self.change_lanes(-1)
-            # But don't leave me in the list of cars
-            app.cars.pop(-1)
-        # If any car had to slow down, turn it red.
-        if near:
-            # self.color = 'red'
-            # if self == app.me:
-            #     print(f"{app.me.speed=}")
-            self.adjust(near_car_index)
-        # Turn back to the original color, blue or green
-        elif self != app.me:
-            self.color = 'blue'
-            self.speed = self.previous_speed
-            self.stuck_behind = []
-        else:
-            self.color = 'green'
-            self.speed += 0.1
-            self.stuck_behind = []
-        self.rect.fill = self.color
-        return near
-    
-    def adjust(self, near_car_index: int) -> None:
-        """Determine if one car is overtaking another and respond. 
-        
-        Can move left, otherwise slow down.  Doesn't pass on the right."""
-        app.cars.append(app.me)
-        blocked_left = False
-        for car in app.cars:
-            if car != self:
-                if (car.lane == self.lane + 1 and 
-                        abs(car.x - self.x) < app.NEAR_TEST
-                ):
-                    blocked_left = True
-                if (car.changing_lanes and 
-                        abs(car.x - self.x) < app.NEAR_TEST
-                ):
-                    blocked_left = True                    
-        if (not blocked_left and 
-                self.lane < app.lanes - 1 and 
-                not self.changing_lanes and 
-                app.frames > self.changed_lanes_frame + 40
-        ):
-            self.change_lanes(1)
-        if self != app.me:
-            self.speed = app.cars[near_car_index].speed
-            for i in self.stuck_behind:
-                if i < len(app.cars) and self.speed < app.cars[i].speed:
-                    self.speed = app.cars[i].speed
-        else:
-            for i in self.stuck_behind:
-                if i < len(app.cars):
-                    app.cars[i].speed = 0
-        if self.x - app.cars[near_car_index].x < app.NEAR_TEST - 1:
-            if self != app.me:
-                self.x += 3
-            else:
-                app.cars[near_car_index].x -= 3
-        app.cars.pop(-1)
 
-class MyCar(Car):
-    """This car is me, the central car in the simulation. 
-    
-    The speed of the simulation always matches my speed.
-    Simulation expects only one instance of this class."""
-    def __init__(self, lane: int):
-        self.color = 'green'
-        self.x = 450
-        self.y = 0
-        # Simulation speed is relative to MyCar.speed
-        # Adding to my speed makes me go faster, this is opposite others.
-        self.speed = 0
-        # At the end, also run the __init__ method from the Car parent class
-        super().__init__(lane)
-        
-    def check_speeds(self) -> None:
-        """If my speed goes down, slow down the entire simulator. 
-        
-        Do this by speeding up all the other cars."""
-        for car in app.cars:
-            if car != self:
-                car.speed -= self.speed
-        self.speed = 0
+def main():
+    """Open the window and run the simulation."""
+    graphics.load(globals())
+    setup()
+    cmu_graphics.run()
 
-class OtherCar(Car):
-    """For all the other cars."""
-    def __init__(self, lane: int, x: int, speed: int):
-        self.color = 'blue'
-        self.x = x
-        self.y = 0
-        # Notice that self.speed is relative to MyCar
-        # Increase in speed value actually slows car because more right is
-        #   farther behind.  This is opposite MyCar.
-        self.speed = speed
-        # Run the parent Car class __init__ method.
-        super().__init__(lane)
-        
-def generate_new_car() -> OtherCar | None:
-    """Algorithm for making additional cars.
-    
-    Notice that cmu_graphics is picky about creating new Rect objects, so 
-        we recycle existing Rect objects using app.removed_cars list.  This
-        happens in Car.__init__()
-    We return None if a new car just won't fit.  In this case, it just fails
-        and no new car is added.
-    """
-    speed = randrange(-6, 7) * 0.05
-    # They can go anywhere if the simulation hasn't started running yet.
-    if app.frames == 0:
-        x = randrange(-2, int(app.width / 50) + 2) * 50
-    else:
-        # But if it has started running, try to generate them off-screen.  If
-        #   they are faster, start them behind, if slower start them ahead.
-        if speed == 0:
-            adj = randrange(0,2)
-            if adj == 0:
-                speed = -0.05
-            else:
-                speed = 0.05
-        if speed > 0:
-            x = -100
-        elif speed < 0:
-            x = app.width + 100
-    if speed < 0:
-        # Make it more likely that slower cars are to the right
-        lane_tmp = randrange(0, app.lanes * app.lanes)
-        lane = app.lanes - 1
-        diff = 1
-        lane_tmp -= diff
-        while lane_tmp >= 0:
-            diff += 2
-            lane_tmp -= diff
-            lane -= 1
-    elif speed > 0:
-        # Make it more likely that faster cars are to the left
-        lane_tmp = randrange(0, app.lanes * app.lanes)
-        lane = 0
-        diff = 1
-        lane_tmp -= diff
-        while lane_tmp >= 0:
-            diff += 2
-            lane_tmp -= diff
-            lane += 1
-    else:
-        lane = randrange(0, app.lanes)
-    # print(f"{x=}, {speed=}, {lane=}, {app.frames=}")
-    # Collision is not an actual collision, but if the location where the car
-    #   is about to generate is occupied, move it around until it can find an
-    #   unoccupied location.
-    collision = True
-    collision_count = 0
-    while collision:
-        # Keep trying to find an open spot for this car to spawn.
-        collision = False
-        collision_count += 1
-        app.cars.append(app.me)
-        for car in app.cars:
-            if lane == car.lane and abs(x - car.x) < app.NEAR_TEST:
-                collision = True
-                # print(lane, x, car.x)
-        if collision:
-            n = randrange(0,4)
-            if n == 0 and lane < app.lanes - 1:
-                lane += 1
-            elif n == 1 and lane > 0:
-                lane -= 1
-            elif n == 2:
-                if app.frames == 0 or x < -app.NEAR_TEST:
-                    x += app.NEAR_TEST
-            elif n == 3:
-                if app.frames == 0 or x > app.width + app.NEAR_TEST:
-                    x -= app.NEAR_TEST
-        app.cars.pop(-1)
-        if collision_count == 1000:
-            break
-    # print(f"{x=}, {speed=}, {lane=}, {app.frames=} {collision_count=}\n")
-    if collision_count < 1000:
-        return OtherCar(lane, x, speed)
-    else:
-        return None
-        
-def purge_cars() -> None:
-    """If cars get far enough off-screen, drop them out of the list."""
-    to_purge = []
-    for i, car in enumerate(app.cars):
-        if car.x > app.width + 1000 or car.x < -1000:
-            to_purge.append(i)
-    for i in to_purge:
-        car = app.cars.pop(i)
-        app.removed_cars.append(car)
 
-setup()
-cmu_graphics.run()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
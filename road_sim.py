@@ -0,0 +1,466 @@
+"""The traffic simulation without any graphics.
+
+road.py draws this simulation in a cmu_graphics window, but everything here
+also runs without a window, e.g. for tests or batch jobs:
+
+    sim = RoadSim(lanes=6, seed=1)
+    for i in range(10000):
+        sim.step()
+
+Cars only know their lane, position, speed and color.  Drawing them is up
+to whoever is showing the simulation.
+"""
+import math
+import random
+import time
+
+from instrument import Stats
+from lane_index import LaneIndex
+from telemetry import DISASTER, TelemetrySink
+
+
+def rounded(d: float) -> int:
+    """Round half away from zero, the same as cmu_graphics.rounded()."""
+    sign = 1 if (d >= 0) else -1
+    d = abs(d)
+    n = int(d)
+    if d - n >= 0.5:
+        n += 1
+    return sign * n
+
+
+class RoadSim:
+    """Everything the traffic simulation knows, and how to advance it."""
+    def __init__(self, lanes: int = 3, width: int = 1200,
+                 near_test: int = 240, seed: int = None,
+                 stats: Stats = None, spawn_every: int = 160,
+                 telemetry: TelemetrySink = None, traffic=None):
+        # All random choices come from here, so the same seed gives the
+        #   same run every time.  No seed means a different run every time.
+        self.rng = random.Random(seed)
+        # Timings and counters, off unless asked for.  Reports the frame
+        #   number every 800 frames either way.
+        self.stats = stats if stats is not None else Stats(report_every=800)
+        # Where to send events like disasters, or None (see telemetry.py)
+        self.telemetry = telemetry
+        # A TrafficStats that follows every car, or None (see
+        #   traffic_stats.py)
+        self.traffic = traffic
+        # Following distance of one car to another.  1 car length = 80 pixels
+        self.NEAR_TEST = near_test
+        # Number of lanes in my road
+        self.lanes = lanes
+        # Size of the window showing the road.  Height depends on # of lanes
+        self.width = width
+        self.height = 100*lanes + 100
+        # Counting frames drawn so we can generate new traffic on a schedule
+        self.frames = 0
+        # Try to add a new car once every this many frames
+        self.spawn_every = spawn_every
+        # All cars on the road, excluding me, by car id in the order they
+        #   were added.  Every car gets the next id, they are never reused.
+        self.cars = {}
+        self.next_id = 0
+        # All cars including me, by lane and sorted by x (see lane_index.py)
+        self.index = LaneIndex()
+        # Cars dropped by purge_cars() in the last frame, so whoever draws
+        #   them can reuse their shapes
+        self.removed_cars = []
+        self.me = MyCar(self, 0)
+        self.index.add(self.me)
+        for i in range(self.rng.randrange(2, 5*lanes)):
+            car = generate_new_car(self)
+            if car is not None:
+                self.add_car(car)
+
+    def add_car(self, car: "OtherCar") -> None:
+        """Put a new car on the road."""
+        self.cars[car.id] = car
+        self.index.add(car)
+        if self.traffic is not None:
+            self.traffic.add_car(self, car)
+
+    def car(self, car_id: int) -> "Car | None":
+        """The car with this id, me included, or None if it is gone."""
+        if car_id == self.me.id:
+            return self.me
+        return self.cars.get(car_id)
+
+    def step(self) -> None:
+        """Update positions of all cars for one frame.
+
+        Create new cars as needed, drop cars no longer in use.
+        """
+        stats = self.stats
+        # Only look at the clock if somebody wants the timings
+        enabled = stats.enabled
+        if enabled:
+            frame_start = time.perf_counter()
+        self.frames += 1
+        self.removed_cars = []
+        # Move my car, adjust as needed
+        me = self.me
+        with stats.phase("my car"):
+            me.move_car()
+            me.check_near()
+            me.check_speeds()
+        # Move and adjust other cars
+        for car in self.cars.values():
+            if enabled:
+                start = time.perf_counter()
+            car.move_car()
+            if enabled:
+                moved = time.perf_counter()
+            near = car.check_near()
+            if enabled:
+                stats.add_time("moving", moved - start)
+                stats.add_time("near checks", time.perf_counter() - moved)
+                if near:
+                    stats.count("near hits")
+            # prevent things getting static by randomly nudging speed by a bit
+            if not near and car is not me:
+                adj = self.rng.randrange(-5, 6)
+                car.speed += 0.001 * adj
+                car.previous_speed += 0.001 * adj
+        # Check who's far enough off-screen that they're not coming on-screen
+        with stats.phase("purging"):
+            purge_cars(self)
+        if self.traffic is not None:
+            with stats.phase("traffic stats"):
+                self.traffic.frame_done(self)
+        # Every once in a while, add a new car
+        if self.frames % self.spawn_every == 0:
+            with stats.phase("spawning"):
+                car = generate_new_car(self)
+            if car is not None:
+                self.add_car(car)
+            with stats.phase("report"):
+                self.report()
+        if enabled:
+            stats.observe("frame ms", 1000 * (time.perf_counter() - frame_start))
+        stats.frame_done(self.frames)
+
+    def report(self) -> None:
+        """Check for cars on top of each other, and collect car stats."""
+        on_screen = 0
+        for car in self.cars.values():
+            if self.traffic is None and -80 < car.x < self.width:
+                on_screen += 1
+            # Only cars in the same lane, less than 80 pixels away
+            for other_car in self.index.between(car.lane, car.x - 80,
+                                                car.x + 80):
+                if other_car is not car and other_car is not self.me:
+                    self.stats.count("disasters")
+                    if self.telemetry is not None:
+                        self.telemetry.add("events", self.frames, DISASTER,
+                                           car.id, other_car.id)
+                    self.stats.event(
+                        f"Disaster at {car.x}, {other_car.x}!\n"
+                        f"Now: {self.frames} "
+                        f"Car 1: {car.frame_created} "
+                        f"Car 2: {other_car.frame_created}"
+                    )
+        if self.traffic is not None:
+            # Counted already this frame
+            on_screen = self.traffic.cars_on_screen()
+        self.stats.observe("cars on screen", on_screen)
+
+
+class Car(object):
+    """Superclass for cars in the simulation.
+
+    Not intended to be called directly, use the classes that inherit from it.
+
+    Cars use __slots__, so each car is a small fixed record instead of a
+    dictionary.  That makes cars smaller and reading their attributes in the
+    per-frame loops faster, though only by about 10% for a road of 90 cars:
+    most of the time goes to finding nearby cars, which is LaneIndex's job.
+    New attributes have to be added to the list.
+    """
+    __slots__ = (
+        "sim", "changing_lanes", "changing_lanes_dir", "lane", "x", "y",
+        "speed", "previous_speed", "changed_lanes_frame", "frame_created",
+        "stuck_behind", "color", "id",
+    )
+
+    def __init__(self, sim: RoadSim, lane: int):
+        """Intended to be called by all subclasses."""
+        # The simulation this car drives in
+        self.sim = sim
+        # Stable number for this car, other cars refer to it by this
+        self.id = sim.next_id
+        sim.next_id += 1
+        # Used when changing lanes
+        self.changing_lanes = False
+        # Which direction we're changing: left (-1) or right (+1)
+        self.changing_lanes_dir = 0
+        # Lane Number, between 0 & lane - 1
+        self.lane = lane
+        # If you have to slow down because someone is in front of you, keep
+        # track of how fast you were going
+        self.previous_speed = self.speed
+        # Which frame number the car finished changing lanes.
+        self.changed_lanes_frame = 0
+        # self.x is set in the subclass
+        self.y = 100 * self.lane + 80
+        # Keep track on when the car was created, for error checking.
+        self.frame_created = sim.frames
+        # Keep track of who this car is stuck behind, as a set of car ids.
+        self.stuck_behind = set()
+
+    def move_car(self) -> None:
+        """Find new correct location, both forward/back (x), and lane (y)."""
+        sim = self.sim
+        if self != sim.me:
+            self.x += rounded(self.speed * 10)
+        else:
+            self.check_speeds()
+        if self.changing_lanes:
+            self.lane += self.changing_lanes_dir * 0.05
+            self.y = 100 * self.lane + 80
+            if abs(self.lane - rounded(self.lane)) < 0.01:
+                self.changing_lanes = False
+                self.changing_lanes_dir = 0
+                self.lane = int(rounded(self.lane))
+                self.y = 100 * self.lane + 80
+                self.changed_lanes_frame = sim.frames
+                # print("Done changing lanes")
+        sim.index.update(self)
+
+    def change_lanes(self, dir: int) -> None:
+        """To change lanes, just change attributes, move_car does the rest."""
+        self.changing_lanes = True
+        self.changing_lanes_dir = dir
+        self.sim.index.update(self)
+        self.sim.stats.count("lane changes")
+
+    def check_near(self) -> bool:
+        """See if another car is near enough to change this car's behavior."""
+        sim = self.sim
+        near = False
+        # Cars (me included) in my lane, less than NEAR_TEST in front of me.
+        #   Note this never includes myself, you're always near yourself.
+        ahead = sim.index.between(self.lane, self.x - sim.NEAR_TEST, self.x)
+        if ahead:
+            near = True
+            # React to the closest one, right in front of me
+            near_car = ahead[-1]
+            # I'm stuck behind them, and whoever they are stuck behind
+            for car in ahead:
+                self.stuck_behind.add(car.id)
+                self.stuck_behind |= car.stuck_behind
+        if not self.changing_lanes:
+            # Any time a car is not in the right lane, and it can go right, it
+            # should go right.  Me included, any car can block the way.
+            blocked_right = self.blocked(self.lane - 1)
+            if not blocked_right and self.lane > 0 and not self.changing_lanes:
+                if sim.frames > self.changed_lanes_frame + 40:
+                    self.change_lanes(-1)
+        # If any car had to slow down, turn it red.
+        if near:
+            # self.color = 'red'
+            # if self == sim.me:
+            #     print(f"{sim.me.speed=}")
+            with sim.stats.phase("adjust (part of near checks)"):
+                self.adjust(near_car)
+        # Turn back to the original color, blue or green
+        elif self != sim.me:
+            self.color = 'blue'
+            self.speed = self.previous_speed
+            self.stuck_behind = set()
+        else:
+            self.color = 'green'
+            self.speed += 0.1
+            self.stuck_behind = set()
+        return near
+
+    def adjust(self, near_car: "Car") -> None:
+        """Determine if one car is overtaking another and respond.
+
+        Can move left, otherwise slow down.  Doesn't pass on the right."""
+        sim = self.sim
+        blocked_left = self.blocked(self.lane + 1)
+        if (not blocked_left and
+                self.lane < sim.lanes - 1 and
+                not self.changing_lanes and
+                sim.frames > self.changed_lanes_frame + 40
+        ):
+            self.change_lanes(1)
+        if self != sim.me:
+            self.speed = near_car.speed
+            for car_id in self.stuck_behind:
+                # Cars that left the road don't hold anyone up anymore
+                car = sim.car(car_id)
+                if car is not None and self.speed < car.speed:
+                    self.speed = car.speed
+        else:
+            for car_id in self.stuck_behind:
+                car = sim.car(car_id)
+                if car is not None:
+                    car.speed = 0
+        if self.x - near_car.x < sim.NEAR_TEST - 1:
+            if self != sim.me:
+                self.x += 3
+                sim.index.update(self)
+            else:
+                near_car.x -= 3
+                sim.index.update(near_car)
+
+    def blocked(self, lane: float) -> bool:
+        """Is another car in lane, or changing lanes, within NEAR_TEST?"""
+        sim = self.sim
+        low = self.x - sim.NEAR_TEST
+        high = self.x + sim.NEAR_TEST
+        for car in sim.index.between(lane, low, high):
+            if car is not self:
+                return True
+        for car in sim.index.changing_between(low, high):
+            if car is not self:
+                return True
+        return False
+
+
+class MyCar(Car):
+    """This car is me, the central car in the simulation.
+
+    The speed of the simulation always matches my speed.
+    Simulation expects only one instance of this class."""
+    __slots__ = ()
+
+    def __init__(self, sim: RoadSim, lane: int):
+        self.color = 'green'
+        self.x = 450
+        self.y = 0
+        # Simulation speed is relative to MyCar.speed
+        # Adding to my speed makes me go faster, this is opposite others.
+        self.speed = 0
+        # At the end, also run the __init__ method from the Car parent class
+        super().__init__(sim, lane)
+
+    def check_speeds(self) -> None:
+        """If my speed goes down, slow down the entire simulator.
+
+        Do this by speeding up all the other cars."""
+        speed = self.speed
+        # Nothing to shift, this happens at least once every frame
+        if speed == 0:
+            return
+        for car in self.sim.cars.values():
+            if car is not self:
+                car.speed -= speed
+        self.speed = 0
+
+
+class OtherCar(Car):
+    """For all the other cars."""
+    __slots__ = ()
+
+    def __init__(self, sim: RoadSim, lane: int, x: int, speed: int):
+        self.color = 'blue'
+        self.x = x
+        self.y = 0
+        # Notice that self.speed is relative to MyCar
+        # Increase in speed value actually slows car because more right is
+        #   farther behind.  This is opposite MyCar.
+        self.speed = speed
+        # Run the parent Car class __init__ method.
+        super().__init__(sim, lane)
+
+
+def generate_new_car(sim: RoadSim) -> OtherCar | None:
+    """Algorithm for making additional cars.
+
+    We return None if a new car just won't fit.  In this case, it just fails
+        and no new car is added.
+    """
+    speed = sim.rng.randrange(-6, 7) * 0.05
+    # They can go anywhere if the simulation hasn't started running yet.
+    if sim.frames == 0:
+        x = sim.rng.randrange(-2, int(sim.width / 50) + 2) * 50
+    else:
+        # But if it has started running, try to generate them off-screen.  If
+        #   they are faster, start them behind, if slower start them ahead.
+        if speed == 0:
+            adj = sim.rng.randrange(0,2)
+            if adj == 0:
+                speed = -0.05
+            else:
+                speed = 0.05
+        if speed > 0:
+            x = -100
+        elif speed < 0:
+            x = sim.width + 100
+    if speed < 0:
+        # Make it more likely that slower cars are to the right
+        lane_tmp = sim.rng.randrange(0, sim.lanes * sim.lanes)
+        lane = sim.lanes - 1
+        diff = 1
+        lane_tmp -= diff
+        while lane_tmp >= 0:
+            diff += 2
+            lane_tmp -= diff
+            lane -= 1
+    elif speed > 0:
+        # Make it more likely that faster cars are to the left
+        lane_tmp = sim.rng.randrange(0, sim.lanes * sim.lanes)
+        lane = 0
+        diff = 1
+        lane_tmp -= diff
+        while lane_tmp >= 0:
+            diff += 2
+            lane_tmp -= diff
+            lane += 1
+    else:
+        lane = sim.rng.randrange(0, sim.lanes)
+    # print(f"{x=}, {speed=}, {lane=}, {sim.frames=}")
+    # Collision is not an actual collision, but if the location where the car
+    #   is about to generate is occupied, move it around until it can find an
+    #   unoccupied location.
+    collision = True
+    collision_count = 0
+    while collision:
+        # Keep trying to find an open spot for this car to spawn.
+        collision_count += 1
+        # Any car (me included) in that lane, less than NEAR_TEST away
+        collision = bool(
+            sim.index.between(lane, x - sim.NEAR_TEST, x + sim.NEAR_TEST)
+        )
+        if collision:
+            n = sim.rng.randrange(0,4)
+            if n == 0 and lane < sim.lanes - 1:
+                lane += 1
+            elif n == 1 and lane > 0:
+                lane -= 1
+            elif n == 2:
+                if sim.frames == 0 or x < -sim.NEAR_TEST:
+                    x += sim.NEAR_TEST
+            elif n == 3:
+                if sim.frames == 0 or x > sim.width + sim.NEAR_TEST:
+                    x -= sim.NEAR_TEST
+        if collision_count == 1000:
+            break
+    # print(f"{x=}, {speed=}, {lane=}, {sim.frames=} {collision_count=}\n")
+    sim.stats.count("spawn retries", collision_count - 1)
+    sim.stats.observe("spawn retries per car", collision_count - 1)
+    if collision_count < 1000:
+        sim.stats.count("cars spawned")
+        return OtherCar(sim, lane, x, speed)
+    else:
+        sim.stats.count("spawn failures")
+        return None
+
+
+def purge_cars(sim: RoadSim) -> None:
+    """If cars get far enough off-screen, drop them from the road."""
+    # Only the ends of each lane can be far enough off-screen
+    to_purge = []
+    for lane in list(sim.index.lanes):
+        to_purge += sim.index.between(lane, -math.inf, -1000)
+        to_purge += sim.index.between(lane, sim.width + 1000, math.inf)
+    sim.stats.count("cars purged", len(to_purge))
+    for car in to_purge:
+        del sim.cars[car.id]
+        sim.index.remove(car)
+        sim.removed_cars.append(car)
+        if sim.traffic is not None:
+            sim.traffic.remove_car(car)
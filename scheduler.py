@@ -0,0 +1,90 @@
+"""Run a simulation at a fixed rate, however fast the frames are drawn.
+
+cmu_graphics calls onStep about app.stepsPerSecond times a second, but only
+if drawing keeps up.  When a frame takes too long, onStep comes late, and
+if the simulation moved one step per onStep, the whole model would slow
+down with it.  FixedStep instead looks at the clock: it adds the real time
+that passed to an accumulator, and runs one simulation step for every
+1 / steps_per_second seconds in there.
+
+    app.scheduler = FixedStep(app.sim.step, steps_per_second=30)
+
+    def onStep():
+        steps = app.scheduler.advance()
+        if app.scheduler.render_due(steps):
+            draw_everything()
+
+If drawing falls far behind, running all the missed steps would make the
+next frame even slower, and so on.  So at most max_steps are run per
+frame, and the time beyond that is dropped.
+"""
+import time
+
+
+class FixedStep:
+    """Calls step() steps_per_second times per second of real time.
+
+    max_steps: most steps run in one advance(), the catch-up cap.
+    max_skipped: most frames in a row render_due() may skip while behind.
+    clock: where the time comes from, in seconds, e.g. a fake in tests.
+    """
+    def __init__(self, step, steps_per_second: float = 30,
+                 max_steps: int = 4, max_skipped: int = 2,
+                 clock=time.perf_counter):
+        if steps_per_second <= 0:
+            err_str = f"Can't run {steps_per_second} steps per second. "
+            err_str += "Use a number greater than 0."
+            raise ValueError(err_str)
+        self.step = step
+        self.dt = 1 / steps_per_second
+        self.max_steps = max_steps
+        self.max_skipped = max_skipped
+        self.clock = clock
+        # Real time not yet turned into steps
+        self.accumulator = 0.0
+        self.last_time = None
+        # True if the last advance() hit max_steps and dropped time
+        self.behind = False
+        # Totals: steps run, steps dropped by the cap, frames not drawn
+        self.steps = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.skipped_in_a_row = 0
+
+    def advance(self) -> int:
+        """Run the steps that are due by now, return how many ran."""
+        now = self.clock()
+        if self.last_time is None:
+            # The very first frame gets one step, to have something to draw
+            self.accumulator = self.dt
+        else:
+            self.accumulator += now - self.last_time
+        self.last_time = now
+        steps = 0
+        while self.accumulator >= self.dt and steps < self.max_steps:
+            self.step()
+            self.accumulator -= self.dt
+            steps += 1
+        self.behind = self.accumulator >= self.dt
+        if self.behind:
+            # Too far behind to catch up, forget the rest
+            dropped = int(self.accumulator / self.dt)
+            self.dropped += dropped
+            self.accumulator -= dropped * self.dt
+        self.steps += steps
+        return steps
+
+    def render_due(self, steps: int) -> bool:
+        """Should this frame be drawn, after advance() ran steps?
+
+        Not if nothing moved.  Not while behind either, so the time goes to
+        the simulation instead, but never more than max_skipped in a row.
+        """
+        if steps == 0:
+            return False
+        if self.behind and self.skipped_in_a_row < self.max_skipped:
+            self.skipped += 1
+            self.skipped_in_a_row += 1
+            return False
+        self.skipped_in_a_row = 0
+        return True
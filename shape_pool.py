@@ -0,0 +1,70 @@
+"""Reuse cmu_graphics shapes instead of making new ones without end.
+
+cmu_graphics only allows so many shapes (app.maxShapeCount, 2000 by
+default), and a shape that is no longer needed still counts until the
+program ends.  A ShapePool hides shapes that are given back and shows them
+again for the next one asked for:
+
+    dots = ShapePool(lambda x, y: Circle(x, y, 10), capacity=500)
+    dot = dots.acquire(100, 100)   # None once 500 dots are in use
+    ...
+    dots.release(dot)              # hidden, ready to be reused
+
+Nothing here imports cmu_graphics, the shapes come from make_shape.
+"""
+
+
+class ShapePool:
+    """Shapes from make_shape, at most capacity of them in use at once.
+
+    capacity=None means no limit.  hits counts shapes that were reused,
+    misses the ones that had to be made.
+    """
+    def __init__(self, make_shape, capacity: int = None):
+        if capacity is not None and capacity < 1:
+            err_str = f"Can't create ShapePool with capacity {capacity}. "
+            err_str += "Use a capacity of at least 1, or None for no limit."
+            raise ValueError(err_str)
+        self.make_shape = make_shape
+        self.capacity = capacity
+        # Hidden shapes, ready to be handed out again
+        self.spare = []
+        self.in_use = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        """Number of shapes made so far, in use or not."""
+        return self.in_use + len(self.spare)
+
+    def full(self) -> bool:
+        """Is every shape in use, with no room to make another?"""
+        return self.capacity is not None and self.in_use >= self.capacity
+
+    def acquire(self, *args):
+        """A visible shape, or None if the pool is full.
+
+        A new shape is made with make_shape(*args).  A reused shape keeps
+        whatever it had before, so set its position and colors after this.
+        """
+        if self.full():
+            return None
+        self.in_use += 1
+        if self.spare:
+            self.hits += 1
+            shape = self.spare.pop()
+            shape.visible = True
+            return shape
+        self.misses += 1
+        return self.make_shape(*args)
+
+    def release(self, shape) -> None:
+        """Hide shape and keep it for the next acquire()."""
+        shape.visible = False
+        self.spare.append(shape)
+        self.in_use -= 1
+
+    def hit_rate(self) -> float:
+        """Share of acquire() calls that reused a shape."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,170 @@
+"""Record the state of a simulation every frame, and play it back later.
+
+A trace file is small and binary.  It starts with a header saying how one
+record is packed (a struct format string), then holds one block per frame:
+
+    frame number, number of records, then that many records
+
+For road.py a record is one car: (id, lane, x, speed).  For particles.py
+it is one particle: (x, y).  All numbers are stored exactly, so two traces
+can be compared bit for bit.
+
+    with TraceWriter("run.trace", ROAD_RECORD) as trace:
+        for i in range(1000):
+            sim.step()
+            trace.write_frame(sim.frames, road_records(sim))
+
+    for frame, records in TraceReader("run.trace"):
+        ...
+"""
+import struct
+
+MAGIC = b"TRC1"
+# Frame number and how many records follow
+FRAME_HEADER = struct.Struct("<II")
+# One car: id, lane (can be in between while changing), x, speed
+ROAD_RECORD = "<Iddd"
+# One particle: x, y
+PARTICLE_RECORD = "<dd"
+
+
+class TraceWriter:
+    """Write frames of records to a trace file."""
+    def __init__(self, path: str, record_format: str):
+        self.record = struct.Struct(record_format)
+        self.file = open(path, "wb")
+        fmt = record_format.encode("ascii")
+        self.file.write(MAGIC + bytes([len(fmt)]) + fmt)
+
+    def write_frame(self, frame: int, records: list) -> None:
+        """Write all the records (tuples) of one frame."""
+        pack = self.record.pack
+        self.file.write(FRAME_HEADER.pack(frame, len(records)))
+        self.file.write(b"".join([pack(*record) for record in records]))
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self) -> "TraceWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class TraceReader:
+    """Read a trace file back, one frame at a time."""
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            header = file.read(5)
+            if header[:4] != MAGIC:
+                raise ValueError(f"{path} is not a trace file.")
+            self.record_format = file.read(header[4]).decode("ascii")
+            self.start = 5 + header[4]
+        self.record = struct.Struct(self.record_format)
+
+    def __iter__(self):
+        """Yield (frame number, list of record tuples) for every frame."""
+        size = self.record.size
+        with open(self.path, "rb") as file:
+            file.seek(self.start)
+            while True:
+                header = file.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    return
+                frame, count = FRAME_HEADER.unpack(header)
+                data = file.read(count * size)
+                yield frame, list(self.record.iter_unpack(data))
+
+
+def road_records(sim) -> list:
+    """One (id, lane, x, speed) record per car, me first."""
+    records = [(sim.me.id, sim.me.lane, sim.me.x, sim.me.speed)]
+    for car in sim.cars.values():
+        records.append((car.id, car.lane, car.x, car.speed))
+    return records
+
+
+def particle_records(sim) -> list:
+    """One (x, y) record per particle."""
+    return [(particle.x, particle.y) for particle in sim.moving()]
+
+
+class TracedCar:
+    """Just enough of a car to draw it during a replay."""
+    __slots__ = ("id", "lane", "x", "y", "speed", "color")
+
+    def __init__(self, car_id: int, lane: float, x: float, speed: float,
+                 color: str):
+        self.id = car_id
+        self.lane = lane
+        self.x = x
+        self.y = 100 * lane + 80
+        self.speed = speed
+        self.color = color
+
+
+class RoadReplay:
+    """Plays a road trace back, looking like a RoadSim to the drawing code.
+
+    Nothing is simulated, step() just reads the next frame.  When the trace
+    runs out, the last frame stays on screen.
+    """
+    def __init__(self, path: str, lanes: int = 3, width: int = 1200):
+        self.lanes = lanes
+        self.width = width
+        self.height = 100*lanes + 100
+        self.frames = 0
+        self.cars = {}
+        self.removed_cars = []
+        self.frame_iter = iter(TraceReader(path))
+        self.step()
+
+    def step(self) -> None:
+        frame = next(self.frame_iter, None)
+        self.removed_cars = []
+        if frame is None:
+            return
+        self.frames, records = frame
+        me_record, *records = records
+        self.me = TracedCar(*me_record, "green")
+        cars = {record[0]: TracedCar(*record, "blue") for record in records}
+        self.removed_cars = [car for car_id, car in self.cars.items()
+                             if car_id not in cars]
+        self.cars = cars
+
+
+class TracedParticle:
+    """Just enough of a particle to draw it during a replay."""
+    __slots__ = ("x", "y")
+
+    def __init__(self, x: float, y: float):
+        self.x = x
+        self.y = y
+
+
+class ParticleReplay:
+    """Plays a particle trace back, looking like a ParticleSim to particles.py.
+
+    Nothing is simulated, step() just reads the next frame.  When the trace
+    runs out, the last frame stays on screen.
+    """
+    # No engine is running, so there is no engine to ask about errors
+    engine = None
+
+    def __init__(self, path: str):
+        self.frames = 0
+        self.traced = []
+        self.frame_iter = iter(TraceReader(path))
+        self.step()
+
+    def moving(self) -> list:
+        return self.traced
+
+    def step(self) -> None:
+        frame = next(self.frame_iter, None)
+        if frame is None:
+            return
+        self.frames, records = frame
+        self.traced = [TracedParticle(x, y) for x, y in records]
@@ -0,0 +1,97 @@
+"""A uniform grid that finds objects near a point without checking them all.
+
+The world is cut into square cells.  Every object is filed under the cell it
+is in, so "who is near (x, y)" only has to look at the cell (x, y) is in and
+the 8 cells around it.  If the cells are at least as big as the distance we
+care about, nobody within that distance can be missed.
+"""
+
+
+class SpatialGrid:
+    """Keys filed by position in a width x height world of square cells.
+
+    Keys can be anything hashable, e.g. an index into a list of particles.
+    Positions outside the world are filed in the nearest edge cell.
+    """
+    def __init__(self, width: int, height: int, cell_size: float):
+        if cell_size <= 0:
+            raise ValueError("cell_size must be a positive number of pixels.")
+        self.cell_size = cell_size
+        self.cols = max(1, int(width // cell_size) + 1)
+        self.rows = max(1, int(height // cell_size) + 1)
+        # One set of keys per cell, row by row
+        self.cells = [set() for i in range(self.cols * self.rows)]
+        # Which cell each key is in, so moving and removing are quick
+        self.cell_of = {}
+
+    def __len__(self) -> int:
+        return len(self.cell_of)
+
+    def __contains__(self, key) -> bool:
+        return key in self.cell_of
+
+    def _col_row(self, x: float, y: float) -> tuple:
+        col = min(max(int(x // self.cell_size), 0), self.cols - 1)
+        row = min(max(int(y // self.cell_size), 0), self.rows - 1)
+        return col, row
+
+    def insert(self, key, x: float, y: float) -> None:
+        """File key under the cell that contains (x, y)."""
+        col, row = self._col_row(x, y)
+        cell = row * self.cols + col
+        self.cells[cell].add(key)
+        self.cell_of[key] = cell
+
+    def move(self, key, x: float, y: float) -> None:
+        """Update where key is.  Nothing changes unless it left its cell."""
+        col, row = self._col_row(x, y)
+        cell = row * self.cols + col
+        old_cell = self.cell_of[key]
+        if cell != old_cell:
+            self.cells[old_cell].discard(key)
+            self.cells[cell].add(key)
+            self.cell_of[key] = cell
+
+    def remove(self, key) -> None:
+        """Forget about key."""
+        self.cells[self.cell_of.pop(key)].discard(key)
+
+    def near(self, x: float, y: float, reach: int = 1):
+        """Yield every key in the cell of (x, y) and the cells around it.
+
+        reach is how many rings of cells to include, 1 means the 3x3 block.
+        Every key within reach * cell_size of (x, y) is returned, along with
+        some keys that are a bit farther away.
+        """
+        col, row = self._col_row(x, y)
+        for r in range(max(row - reach, 0), min(row + reach + 1, self.rows)):
+            start = r * self.cols
+            for c in range(max(col - reach, 0), min(col + reach + 1, self.cols)):
+                yield from self.cells[start + c]
+
+    def ring(self, x: float, y: float, reach: int):
+        """Yield every key exactly reach cells away from the cell of (x, y).
+
+        near(x, y, reach) is the same as ring() for 0, 1, ... reach.  No key
+        in a ring is closer to (x, y) than (reach - 1) * cell_size, which
+        lets a search stop as soon as it has found what it wants.
+        """
+        col, row = self._col_row(x, y)
+        if reach == 0:
+            yield from self.cells[row * self.cols + col]
+            return
+        first_col = max(col - reach, 0)
+        last_col = min(col + reach, self.cols - 1)
+        # Top and bottom rows of the ring, whole
+        for r in (row - reach, row + reach):
+            if 0 <= r < self.rows:
+                start = r * self.cols
+                for c in range(first_col, last_col + 1):
+                    yield from self.cells[start + c]
+        # Left and right columns, without the corners done above
+        for r in range(max(row - reach + 1, 0),
+                       min(row + reach, self.rows)):
+            start = r * self.cols
+            for c in (col - reach, col + reach):
+                if 0 <= c < self.cols:
+                    yield from self.cells[start + c]
@@ -0,0 +1,267 @@
+"""Stream what happens in a simulation to a file, without slowing it down.
+
+A telemetry file holds a few tables with fixed columns, e.g. one row per car
+per frame.  Rows are collected column by column in arrays, and every
+chunk_rows rows the full columns are handed to a background thread that
+writes them out.  The simulation never waits for the disk: if the writer
+falls so far behind that max_chunks are waiting, further chunks are
+dropped and counted, unless block=True.  close() returns how many rows
+were dropped, and read_telemetry() refuses a file with chunks missing
+unless allow_gaps=True.
+
+    with TelemetrySink("run.tlm", ROAD_TABLES) as sink:
+        sim = RoadSim(telemetry=sink)
+        for i in range(1000000):
+            sim.step()
+            record_road(sink, sim)
+
+    tables = read_telemetry("run.tlm")
+    tables["cars"]["x"]     # array of every car's x, in every frame
+
+The file starts with the table layouts, then holds chunks:
+
+    table number, chunk number, number of rows, then each column's values
+    as raw bytes
+
+Chunks are numbered from 0 in the order they were filled, dropped ones
+included, so a gap in the numbers shows where rows are missing.  close()
+ends the file with a header for table END and no rows, whose chunk number
+is how many chunks there were, so dropped chunks at the end show too.
+
+Columns are array.array typecodes, e.g. "I" for ids and frames, "d" for
+positions and speeds.  numpy.asarray() turns a column into a NumPy array.
+"""
+import array
+import queue
+import struct
+import sys
+import threading
+
+MAGIC = b"TLM2"
+# Table number, chunk number and how many rows follow
+CHUNK_HEADER = struct.Struct("<BII")
+# Table number of the header that ends the file
+END = 255
+
+# Event kinds, for the "events" table
+DISASTER = 1
+
+# name: [(column, array typecode), ...]
+ROAD_TABLES = {
+    "cars": [("frame", "I"), ("id", "I"), ("lane", "d"), ("x", "d"),
+             ("speed", "d")],
+    # Two cars on top of each other: a and b are their ids
+    "events": [("frame", "I"), ("kind", "B"), ("a", "I"), ("b", "I")],
+}
+PARTICLE_TABLES = {
+    "particles": [("frame", "I"), ("index", "I"), ("x", "d"), ("y", "d")],
+}
+
+
+class TelemetrySink:
+    """Collect rows for the tables and write them on a background thread."""
+    def __init__(self, path: str, tables: dict, chunk_rows: int = 8192,
+                 max_chunks: int = 16, block: bool = False):
+        self.tables = {name: list(columns) for name, columns in tables.items()}
+        self.numbers = {name: i for i, name in enumerate(self.tables)}
+        self.chunk_rows = chunk_rows
+        self.block = block
+        # Chunks filled so far, and rows dropped because the writer was too
+        #   far behind
+        self.chunks = 0
+        self.dropped = 0
+        # What went wrong in the writer thread, raised again by _send() and
+        #   close()
+        self.error = None
+        self.file = open(path, "wb")
+        self._write_header()
+        # table name -> [array per column], filled until chunk_rows
+        self.columns = {name: self._new_columns(name) for name in self.tables}
+        self.queue = queue.Queue(max_chunks)
+        self.thread = threading.Thread(target=self._write_chunks, daemon=True)
+        self.thread.start()
+
+    def _write_header(self) -> None:
+        header = bytearray(MAGIC)
+        header += b"<" if sys.byteorder == "little" else b">"
+        header.append(len(self.tables))
+        for name, columns in self.tables.items():
+            header += _short_string(name)
+            header.append(len(columns))
+            for column, typecode in columns:
+                header += _short_string(column) + typecode.encode("ascii")
+        self.file.write(header)
+
+    def _new_columns(self, name: str) -> list:
+        return [array.array(typecode) for column, typecode in self.tables[name]]
+
+    def add(self, name: str, *row) -> None:
+        """Add one row to table name, one value per column."""
+        columns = self.columns[name]
+        for column, value in zip(columns, row):
+            column.append(value)
+        if len(columns[0]) >= self.chunk_rows:
+            self._send(name)
+
+    def add_columns(self, name: str, *values) -> None:
+        """Add many rows at once, given as one list of values per column."""
+        columns = self.columns[name]
+        for column, column_values in zip(columns, values):
+            column.extend(column_values)
+        if len(columns[0]) >= self.chunk_rows:
+            self._send(name)
+
+    def flush(self) -> None:
+        """Hand every row collected so far to the writer."""
+        for name in self.tables:
+            if len(self.columns[name][0]):
+                self._send(name)
+
+    def close(self) -> int:
+        """Write everything that's left and close the file.
+
+        Returns how many rows were dropped.  If writing failed, the error
+        is raised here, after the file is closed.
+        """
+        if self.file.closed:
+            return self.dropped
+        try:
+            self.flush()
+        finally:
+            # Waits for room even when not blocking, so the end isn't lost.
+            #   The writer keeps taking chunks after an error, so this
+            #   can't wait forever.
+            self.queue.put(None)
+            self.thread.join()
+            if self.error is None:
+                self.file.write(CHUNK_HEADER.pack(END, self.chunks, 0))
+            self.file.close()
+        if self.error is not None:
+            raise self.error
+        return self.dropped
+
+    def __enter__(self) -> "TelemetrySink":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _send(self, name: str) -> None:
+        if self.error is not None:
+            raise self.error
+        columns = self.columns[name]
+        self.columns[name] = self._new_columns(name)
+        chunk = (self.numbers[name], self.chunks, columns)
+        self.chunks += 1
+        if self.block:
+            self.queue.put(chunk)
+            return
+        try:
+            self.queue.put_nowait(chunk)
+        except queue.Full:
+            self.dropped += len(columns[0])
+
+    def _write_chunks(self) -> None:
+        """The background thread: write chunks until None comes along.
+
+        If a write fails, the error is kept for the simulation's thread and
+        the chunks after it are thrown away, so nobody waits on a full queue.
+        """
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                return
+            if self.error is not None:
+                continue
+            number, sequence, columns = chunk
+            try:
+                self.file.write(CHUNK_HEADER.pack(number, sequence,
+                                                  len(columns[0])))
+                for column in columns:
+                    column.tofile(self.file)
+            except Exception as error:
+                self.error = error
+
+
+def _short_string(text: str) -> bytes:
+    data = text.encode("utf-8")
+    return bytes([len(data)]) + data
+
+
+def read_telemetry(path: str, allow_gaps: bool = False) -> dict:
+    """Every table in a telemetry file, as {table: {column: array}}.
+
+    Raises ValueError if chunks were dropped while writing, since the tables
+    would have rows missing.  allow_gaps=True returns them anyway.
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    if data[:4] != MAGIC:
+        raise ValueError(f"{path} is not a telemetry file.")
+    swap = data[4:5] != (b"<" if sys.byteorder == "little" else b">")
+    pos = 6
+    layouts = []
+    for i in range(data[5]):
+        name, pos = _read_short_string(data, pos)
+        count = data[pos]
+        pos += 1
+        columns = []
+        for j in range(count):
+            column, pos = _read_short_string(data, pos)
+            columns.append((column, chr(data[pos])))
+            pos += 1
+        layouts.append((name, columns))
+    tables, missing = _read_chunks(data, pos, layouts, swap)
+    if missing and not allow_gaps:
+        err_str = f"{path} is missing {missing} chunks, dropped because the "
+        err_str += "writer fell behind.  Use allow_gaps=True to read the rest."
+        raise ValueError(err_str)
+    return tables
+
+
+def _read_short_string(data: bytes, pos: int) -> tuple:
+    size = data[pos]
+    return data[pos + 1:pos + 1 + size].decode("utf-8"), pos + 1 + size
+
+
+def _read_chunks(data: bytes, pos: int, layouts: list, swap: bool) -> tuple:
+    """(tables, how many chunks are missing) for the chunks from pos on."""
+    tables = {name: {column: array.array(typecode)
+                     for column, typecode in columns}
+              for name, columns in layouts}
+    next_chunk = 0
+    missing = 0
+    while pos + CHUNK_HEADER.size <= len(data):
+        number, sequence, rows = CHUNK_HEADER.unpack_from(data, pos)
+        pos += CHUNK_HEADER.size
+        missing += sequence - next_chunk
+        if number == END:
+            break
+        next_chunk = sequence + 1
+        name, columns = layouts[number]
+        for column, typecode in columns:
+            values = array.array(typecode)
+            size = rows * values.itemsize
+            values.frombytes(data[pos:pos + size])
+            if swap:
+                values.byteswap()
+            tables[name][column].extend(values)
+            pos += size
+    return tables, missing
+
+
+def record_road(sink: TelemetrySink, sim) -> None:
+    """One "cars" row per car for the current frame, me first."""
+    cars = [sim.me, *sim.cars.values()]
+    sink.add_columns("cars", [sim.frames] * len(cars),
+                     [car.id for car in cars], [car.lane for car in cars],
+                     [car.x for car in cars], [car.speed for car in cars])
+
+
+def record_particles(sink: TelemetrySink, sim) -> None:
+    """One "particles" row per particle for the current frame."""
+    particles = sim.moving()
+    sink.add_columns("particles", [sim.frames] * len(particles),
+                     range(len(particles)),
+                     [particle.x for particle in particles],
+                     [particle.y for particle in particles])
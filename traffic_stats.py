@@ -0,0 +1,190 @@
+"""Traffic numbers kept up to date as the road simulation runs.
+
+A TrafficStats follows every car from the moment it is added to the road
+until it is purged, and looks at each car once per frame.  From that it
+keeps running totals over the last window frames, so any of these can be
+asked for at any frame without going over the cars again:
+
+    flow(lane)          cars passing me (or passed by me) per 1000 frames
+    density(lane)       cars on screen per 1000 pixels of lane
+    mean_speed()        speed of the other cars relative to mine, in pixels
+                        per frame.  Positive means slower than me.
+    lane_change_rate()  lane changes per car per 1000 frames
+    stuck_share()       share of the time cars are stuck behind another car
+
+    traffic = TrafficStats(window=300)
+    sim = RoadSim(traffic=traffic)
+    for i in range(10000):
+        sim.step()
+    print(traffic.summary())
+
+lane=None means all lanes together.
+"""
+from collections import deque
+
+
+class TrafficStats:
+    """Rolling traffic numbers over the last window frames of a RoadSim."""
+    def __init__(self, window: int = 300):
+        if window < 1:
+            err_str = f"Can't keep traffic numbers over {window} frames. "
+            err_str += "Use a window of at least 1 frame."
+            raise ValueError(err_str)
+        self.window = window
+        self.lanes = None
+        self.width = None
+        # car id: [ahead of me, changing lanes, frames stuck so far]
+        self.cars = {}
+        # One sample per frame, the oldest is dropped once there are window
+        #   of them: (crossings per lane, cars on screen per lane, speed
+        #   total, cars, lane changes, cars stuck)
+        self.samples = deque()
+        self.crossings = []
+        self.on_screen = []
+        self.speed_total = 0.0
+        self.car_frames = 0
+        self.lane_changes = 0
+        self.stuck = 0
+        # Totals since the start, never dropped
+        self.frames = 0
+        self.passed = 0
+        self.passed_me = 0
+        self.finished_cars = 0
+        self.finished_stuck_frames = 0
+
+    def _start(self, sim) -> None:
+        self.lanes = sim.lanes
+        self.width = sim.width
+        self.crossings = [0] * sim.lanes
+        self.on_screen = [0] * sim.lanes
+
+    def add_car(self, sim, car) -> None:
+        """Start following car, called when it is put on the road."""
+        if self.lanes is None:
+            self._start(sim)
+        self.cars[car.id] = [car.x < sim.me.x, car.changing_lanes, 0]
+
+    def remove_car(self, car) -> None:
+        """Stop following car, called when it is purged."""
+        ahead, changing, stuck_frames = self.cars.pop(car.id)
+        self.finished_cars += 1
+        self.finished_stuck_frames += stuck_frames
+
+    def frame_done(self, sim) -> None:
+        """Look at every car once, after they all moved this frame."""
+        if self.lanes is None:
+            self._start(sim)
+        crossings = [0] * self.lanes
+        on_screen = [0] * self.lanes
+        speed_total = 0.0
+        lane_changes = 0
+        stuck = 0
+        my_x = sim.me.x
+        width = self.width
+        cars = self.cars
+        for car in sim.cars.values():
+            state = cars[car.id]
+            # The nearest whole lane, while in between two of them
+            lane = int(car.lane + 0.5)
+            ahead = car.x < my_x
+            if ahead != state[0]:
+                crossings[lane] += 1
+                if ahead:
+                    self.passed_me += 1
+                else:
+                    self.passed += 1
+                state[0] = ahead
+            if car.changing_lanes and not state[1]:
+                lane_changes += 1
+            state[1] = car.changing_lanes
+            if car.stuck_behind:
+                stuck += 1
+                state[2] += 1
+            if -80 < car.x < width:
+                on_screen[lane] += 1
+            speed_total += car.speed
+        self._add_sample((crossings, on_screen, speed_total, len(sim.cars),
+                          lane_changes, stuck))
+        self.frames += 1
+
+    def _add_sample(self, sample: tuple) -> None:
+        self.samples.append(sample)
+        self._count(sample, 1)
+        if len(self.samples) > self.window:
+            self._count(self.samples.popleft(), -1)
+
+    def _count(self, sample: tuple, sign: int) -> None:
+        crossings, on_screen, speed_total, cars, lane_changes, stuck = sample
+        for lane in range(self.lanes):
+            self.crossings[lane] += sign * crossings[lane]
+            self.on_screen[lane] += sign * on_screen[lane]
+        self.speed_total += sign * speed_total
+        self.car_frames += sign * cars
+        self.lane_changes += sign * lane_changes
+        self.stuck += sign * stuck
+
+    def _per_lane(self, totals: list, lane) -> float:
+        return sum(totals) if lane is None else totals[lane]
+
+    def flow(self, lane: int = None) -> float:
+        """Cars crossing my position per 1000 frames, either way."""
+        if not self.samples:
+            return 0.0
+        return 1000 * self._per_lane(self.crossings, lane) / len(self.samples)
+
+    def density(self, lane: int = None) -> float:
+        """Cars on screen per 1000 pixels of lane."""
+        if not self.samples:
+            return 0.0
+        lanes = self.lanes if lane is None else 1
+        cars = self._per_lane(self.on_screen, lane) / len(self.samples)
+        return 1000 * cars / (self.width * lanes)
+
+    def mean_speed(self) -> float:
+        """Other cars' speed relative to mine in pixels per frame."""
+        if not self.car_frames:
+            return 0.0
+        # Cars move rounded(speed * 10) pixels each frame
+        return 10 * self.speed_total / self.car_frames
+
+    def lane_change_rate(self) -> float:
+        """Lane changes started per car per 1000 frames."""
+        if not self.car_frames:
+            return 0.0
+        return 1000 * self.lane_changes / self.car_frames
+
+    def stuck_share(self) -> float:
+        """Share of car-frames spent stuck behind another car, 0 to 1."""
+        if not self.car_frames:
+            return 0.0
+        return self.stuck / self.car_frames
+
+    def cars_on_screen(self) -> int:
+        """Cars on screen in the last frame."""
+        return sum(self.samples[-1][1]) if self.samples else 0
+
+    def stuck_frames(self, car_id: int) -> int:
+        """Frames the car has been stuck behind others since it was added."""
+        return self.cars[car_id][2]
+
+    def summary(self) -> dict:
+        """Every number at once, e.g. to print or to save."""
+        numbers = {
+            "frames": self.frames,
+            "flow": self.flow(),
+            "density": self.density(),
+            "mean_speed": self.mean_speed(),
+            "lane_change_rate": self.lane_change_rate(),
+            "stuck_share": self.stuck_share(),
+            "passed": self.passed,
+            "passed_me": self.passed_me,
+            # Of the cars that left the road, how long each was stuck
+            "stuck_frames_per_car": (
+                self.finished_stuck_frames / self.finished_cars
+                if self.finished_cars else 0.0
+            ),
+        }
+        for lane in range(self.lanes or 0):
+            numbers[f"flow_lane_{lane}"] = self.flow(lane)
+            numbers[f"density_lane_{lane}"] = self.density(lane)
+        return numbers